@@ -5,13 +5,17 @@ A股三合一多策略选股器
 数据源: AKShare (全市场行情 + 日K线) + 新浪财经 (最新名称)
 """
 
-import akshare as ak
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
+import functools
 import importlib.util
-import urllib.request
+import math
+import requests
 import re
+import statistics
+import threading
 import warnings
 import time
 import sys
@@ -19,6 +23,16 @@ import os
 
 warnings.filterwarnings('ignore')
 
+# 主板(60/00) + 创业板(30)，天然排除科创板(688/689)和北交所
+_CODE_RE = re.compile(r'^(?:60|00|30)\d{4}$')
+
+# 新浪行情: var hq_str_sh600000="浦发银行,...";（名称不跨越引号，空结果不会误匹配下一行）
+_SINA_RE = re.compile(r'hq_str_(\w{8})="([^,"]+)')
+
+# 新浪行情复用同一个keep-alive连接池，避免每批请求重新建连
+_SINA_SESSION = requests.Session()
+_SINA_SESSION.headers['Referer'] = 'http://finance.sina.com.cn'
+
 # 修复Windows终端中文输出
 if sys.platform == 'win32':
     try:
@@ -27,6 +41,24 @@ if sys.platform == 'win32':
         pass
 
 
+class RateLimiter:
+    """令牌桶限速器（线程安全）：平均每秒最多 max_per_second 次请求"""
+
+    def __init__(self, max_per_second):
+        self.interval = 1.0 / max_per_second
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+
+    def acquire(self):
+        """取得一个令牌，必要时休眠等待"""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
 def import_class_from_file(file_path, module_name, class_name):
     """从文件动态导入类"""
     spec = importlib.util.spec_from_file_location(module_name, file_path)
@@ -35,109 +67,183 @@ def import_class_from_file(file_path, module_name, class_name):
     return getattr(module, class_name)
 
 
+def _write_csv(df, path):
+    """写出带BOM的UTF-8 CSV（Excel直接打开中文不乱码），优先使用pyarrow的C++写入器"""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except Exception:
+        # 未安装pyarrow或存在混合类型列时，退回pandas写入器
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+        return
+    with open(path, 'wb') as f:
+        f.write(b'\xef\xbb\xbf')
+        pacsv.write_csv(table, f)
+
+
+def _fetch_sina(url):
+    """请求一批新浪行情（GBK编码文本）；HTTP错误抛出异常，不把错误页当作行情解析"""
+    response = _SINA_SESSION.get(url, timeout=10)
+    response.raise_for_status()
+    return response.content.decode('gbk')
+
+
 class CombinedScreener:
     """三合一多策略选股器"""
 
     def __init__(self):
-        self.max_workers = 30
+        # K线并发线程数：预热阶段按实测请求耗时在[min, max]内自适应
+        self.min_workers = 8
+        self.max_workers = 64
+        self.probe_count = 5
+        self.target_fetch_seconds = 60  # 期望的K线获取总耗时（不低于限速决定的下限，见 _bulk_fetch_history）
+        self.max_requests_per_second = 50
+        self.rate_limiter = RateLimiter(max_per_second=self.max_requests_per_second)  # 防止并发过高触发限流
         self.history_days = 200  # 取三个策略中最大值（放量突破需要200天）
+        self.cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'stock_screener')
 
-        # 动态导入三个策略类
-        skills_dir = os.path.join(os.path.dirname(__file__), '..')
+        # K线查询区间（每次运行只计算一次）
+        now = datetime.now()
+        self._end_date = now.strftime('%Y%m%d')
+        self._start_date = (now - timedelta(days=self.history_days * 2)).strftime('%Y%m%d')
 
+        # 三个策略类在首次使用时才动态导入（见下方 cached_property）
+        self.skills_dir = os.path.join(os.path.dirname(__file__), '..')
+
+    # 实例化（仅复用check_pattern逻辑，不使用其数据获取方法）
+    @functools.cached_property
+    def reversal_screener(self):
+        """三日反转策略（首次访问时动态导入）"""
         ReversalScreener = import_class_from_file(
-            os.path.join(skills_dir, 'stock-pattern-screener', 'stock_screener.py'),
+            os.path.join(self.skills_dir, 'stock-pattern-screener', 'stock_screener.py'),
             'reversal_module',
             'StockPatternScreener'
         )
+        return ReversalScreener()
+
+    @functools.cached_property
+    def volume_screener(self):
+        """放量突破策略（首次访问时动态导入）"""
         VolumeBreakoutScreener = import_class_from_file(
-            os.path.join(skills_dir, 'consolidation-breakout-screener', 'consolidation_breakout_screener.py'),
+            os.path.join(self.skills_dir, 'consolidation-breakout-screener', 'consolidation_breakout_screener.py'),
             'volume_breakout_module',
             'ConsolidationBreakoutScreener'
         )
+        return VolumeBreakoutScreener()
+
+    @functools.cached_property
+    def shrink_screener(self):
+        """缩量突破策略（首次访问时动态导入）"""
         ShrinkBreakoutScreener = import_class_from_file(
-            os.path.join(skills_dir, 'stock-consolidation-breakout', 'stock_screener.py'),
+            os.path.join(self.skills_dir, 'stock-consolidation-breakout', 'stock_screener.py'),
             'shrink_breakout_module',
             'ConsolidationBreakoutScreener'
         )
-
-        # 实例化（仅复用check_pattern逻辑，不使用其数据获取方法）
-        self.reversal_screener = ReversalScreener()
-        self.volume_screener = VolumeBreakoutScreener()
-        self.shrink_screener = ShrinkBreakoutScreener()
+        return ShrinkBreakoutScreener()
 
     def get_stock_list(self):
         """使用AKShare全市场实时行情一次获取 + 预筛选"""
+        import akshare as ak  # 延迟导入：仅实际取数时才加载
+
         print("正在获取全市场实时行情（ak.stock_zh_a_spot_em）...")
         try:
             df = ak.stock_zh_a_spot_em()
             total_market = len(df)
             print(f"全市场共 {total_market} 只股票")
 
-            stocks = df.copy()
-
-            # 排除ST和退市
-            stocks = stocks[~stocks['名称'].str.contains('ST|退', na=False)]
-
-            # 仅保留主板(60/00)和创业板(30)，排除科创板(688/689)和北交所
-            stocks = stocks[stocks['代码'].str.match(r'^(6|0|3)\d{5}$')]
-            stocks = stocks[~stocks['代码'].str.startswith('688')]
-            stocks = stocks[~stocks['代码'].str.startswith('689')]
-
-            after_exclude = len(stocks)
-            print(f"排除ST/科创板/北交所后: {after_exclude} 只")
+            # 排除ST和退市；仅保留主板(60/00)和创业板(30)，排除科创板(688/689)和北交所
+            exclude_mask = (
+                df['代码'].str.match(_CODE_RE)
+                & ~df['名称'].str.contains('ST|退', na=False)
+            )
+            print(f"排除ST/科创板/北交所后: {int(exclude_mask.sum())} 只")
 
             # 预筛选：今日收阳（最新价 > 今开）—— 三个策略的共同必要条件
-            latest = pd.to_numeric(stocks['最新价'], errors='coerce')
-            today_open = pd.to_numeric(stocks['今开'], errors='coerce')
-            stocks = stocks[(latest > today_open) & latest.notna() & today_open.notna()]
+            # NaN参与比较结果为False，无需单独判断notna
+            prices = df[['最新价', '今开']].apply(pd.to_numeric, errors='coerce')
+            stocks = df[exclude_mask & (prices['最新价'] > prices['今开'])]
 
             print(f"今日收阳预筛选后: {len(stocks)} 只")
 
-            result = []
-            for _, row in stocks.iterrows():
-                result.append({
-                    'code': row['代码'],
-                    'name': row['名称'],
-                })
-
-            return result
+            return stocks.rename(columns={'代码': 'code', '名称': 'name'})[['code', 'name']].to_dict('records')
         except Exception as e:
             print(f"获取行情数据失败: {e}")
             return []
 
-    def get_stock_history_ak(self, code):
-        """使用AKShare获取单只股票历史K线数据（统一获取200天）"""
-        try:
-            end_date = datetime.now().strftime('%Y%m%d')
-            start_date = (datetime.now() - timedelta(days=self.history_days * 2)).strftime('%Y%m%d')
-
-            df = ak.stock_zh_a_hist(
-                symbol=code,
-                period="daily",
-                start_date=start_date,
-                end_date=end_date,
-                adjust="qfq"
-            )
+    def _fetch_history_ak(self, code, start_date, end_date):
+        """调用AKShare获取[start_date, end_date]区间的前复权日K线（统一列名）"""
+        import akshare as ak  # 延迟导入：仅实际取数时才加载
+
+        self.rate_limiter.acquire()
+        df = ak.stock_zh_a_hist(
+            symbol=code,
+            period="daily",
+            start_date=start_date,
+            end_date=end_date,
+            adjust="qfq"
+        )
+        if df is None or len(df) == 0:
+            return None
 
-            if df is None or len(df) < 30:
-                return None
+        # 统一列名
+        df = df.rename(columns={
+            '日期': 'date', '开盘': 'open', '最高': 'high',
+            '最低': 'low', '收盘': 'close', '成交量': 'volume'
+        })
+        df = df[['date', 'open', 'high', 'low', 'close', 'volume']]
+
+        num_cols = ['open', 'high', 'low', 'close', 'volume']
+        df[num_cols] = df[num_cols].apply(pd.to_numeric, errors='coerce')
+        return df.dropna()
+
+    def _read_history_cache(self, code):
+        """读取本地K线缓存，不存在或损坏时返回None"""
+        path = os.path.join(self.cache_dir, f'{code}.parquet')
+        if not os.path.exists(path):
+            return None
+        try:
+            df = pd.read_parquet(path)
+            return df if len(df) > 0 else None
+        except Exception:
+            return None
 
-            # 统一列名
-            df = df.rename(columns={
-                '日期': 'date', '开盘': 'open', '最高': 'high',
-                '最低': 'low', '收盘': 'close', '成交量': 'volume'
-            })
-            df = df[['date', 'open', 'high', 'low', 'close', 'volume']].copy()
+    def _write_history_cache(self, code, df):
+        """写回本地K线缓存（失败不影响筛选）"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            df.to_parquet(os.path.join(self.cache_dir, f'{code}.parquet'),
+                          index=False, compression='zstd')
+        except Exception:
+            pass
 
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            df = df.dropna()
+    def get_stock_history_ak(self, code):
+        """获取单只股票历史K线（统一获取200天，本地缓存 + 增量更新）"""
+        try:
+            df = None
+
+            # 有缓存时只增量获取最后缓存日及之后的K线
+            cached = self._read_history_cache(code)
+            if cached is not None:
+                last_date = cached['date'].iloc[-1]
+                new = self._fetch_history_ak(
+                    code, pd.Timestamp(last_date).strftime('%Y%m%d'), self._end_date
+                )
+                # 重叠日收盘价不一致说明发生了除权（前复权价格整体重算），缓存作废
+                if (new is not None and len(new) > 0
+                        and pd.Timestamp(new['date'].iloc[0]) == pd.Timestamp(last_date)
+                        and round(new['close'].iloc[0], 2) == round(cached['close'].iloc[-1], 2)):
+                    df = pd.concat([cached, new]).drop_duplicates('date', keep='last')
+
+            if df is None:
+                df = self._fetch_history_ak(code, self._start_date, self._end_date)
 
-            if len(df) < 30:
+            if df is None or len(df) < 30:
                 return None
 
-            return df.tail(self.history_days).reset_index(drop=True)
+            df = df.tail(self.history_days).reset_index(drop=True)
+            self._write_history_cache(code, df)
+            return df
         except Exception:
             return None
 
@@ -152,32 +258,75 @@ class CombinedScreener:
                 prefix = 'sh' if code.startswith('6') else 'sz'
                 sina_codes.append(f'{prefix}{code}')
             batch_size = 100
-            for i in range(0, len(sina_codes), batch_size):
-                batch = sina_codes[i:i + batch_size]
-                url = 'http://hq.sinajs.cn/list=' + ','.join(batch)
-                req = urllib.request.Request(url, headers={'Referer': 'http://finance.sina.com.cn'})
-                response = urllib.request.urlopen(req, timeout=10)
-                content = response.read().decode('gbk')
-                for line in content.strip().split('\n'):
-                    match = re.search(r'hq_str_(\w+)="([^,]+)', line)
-                    if match:
-                        sina_code = match.group(1)
-                        name = match.group(2)
-                        pure_code = sina_code[2:]
-                        name_map[pure_code] = name
+            urls = [
+                'http://hq.sinajs.cn/list=' + ','.join(sina_codes[i:i + batch_size])
+                for i in range(0, len(sina_codes), batch_size)
+            ]
+            # 单批失败只丢失该批名称，其余批次结果保留
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [executor.submit(_fetch_sina, url) for url in urls]
+                failed = 0
+                for future in futures:
+                    try:
+                        content = future.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"获取最新名称失败（{failed}/{len(urls)} 批）: {e}")
+                        continue
+                    for sina_code, name in _SINA_RE.findall(content):
+                        name_map[sina_code[2:]] = name
         except Exception as e:
             print(f"获取最新名称失败: {e}")
         return name_map
 
-    def screen_single_stock(self, stock):
-        """对单只股票运行全部3个策略（共享同一份K线数据）"""
+    def _bulk_fetch_history(self, codes):
+        """批量预取全部股票K线，返回 {code: DataFrame}（获取失败的股票不在其中）"""
+        df_map = {}
+        total = len(codes)
+
+        # 预热：串行请求少量股票，测量单次请求耗时
+        probe_codes = codes[:self.probe_count]
+        latencies = []
+        for code in probe_codes:
+            t0 = time.perf_counter()
+            df = self.get_stock_history_ak(code)
+            latencies.append(time.perf_counter() - t0)
+            if df is not None:
+                df_map[code] = df
+
+        rest = codes[len(probe_codes):]
+        rtt = statistics.median(latencies) if latencies else 0
+        # 限速器决定总耗时下限（约5000只 / 50次每秒 ≈ 100秒），目标耗时不可能低于它；
+        # 跑满限速只需 速率×单次耗时 个线程，更多线程只会在限速器上排队
+        min_seconds = len(rest) / self.max_requests_per_second
+        target_seconds = max(self.target_fetch_seconds, min_seconds)
+        workers = max(self.min_workers,
+                      min(self.max_workers, math.ceil(len(rest) * rtt / target_seconds)))
+        print(f"单次请求耗时中位数 {rtt:.2f}秒，使用 {workers} 线程并发获取K线"
+              f"（限速 {self.max_requests_per_second} 次/秒，预计不少于 {target_seconds:.0f} 秒）")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.get_stock_history_ak, code): code for code in rest}
+            # 进度条最多每秒刷新一次，避免频繁写终端
+            for future in tqdm(as_completed(futures), total=total, initial=len(probe_codes),
+                               desc="K线获取", mininterval=1.0):
+                try:
+                    df = future.result()
+                except Exception:
+                    df = None
+                if df is not None:
+                    df_map[futures[future]] = df
+        return df_map
+
+    def screen_single_stock(self, stock, df):
+        """对单只股票运行全部3个策略（共享同一份预取的K线数据）"""
         code = stock['code']
         name = stock['name']
 
-        # 只获取一次K线数据
-        df = self.get_stock_history_ak(code)
-        if df is None:
-            return None
+        # 三个策略的共同必要条件：最后一根（前复权）K线收阳，不满足时无需逐个检查
+        last = df.iloc[-1]
+        if last['close'] <= last['open']:
+            return stock, None
 
         results = {}
 
@@ -205,7 +354,7 @@ class CombinedScreener:
         except Exception:
             pass
 
-        return results if results else None
+        return stock, (results if results else None)
 
     def run(self):
         """运行三合一筛选"""
@@ -223,13 +372,19 @@ class CombinedScreener:
             print("获取股票列表失败，退出")
             return
 
-        # 第二步：多线程并发筛选
-        print(f"\n开始筛选（{self.max_workers}线程并发）...")
+        # 第二步：一次性批量预取K线（I/O集中在此阶段）
+        print("\n开始获取K线...")
+        df_map = self._bulk_fetch_history([s['code'] for s in stocks])
+        print(f"成功获取K线: {len(df_map)}/{len(stocks)} 只")
+
+        # 第三步：基于预取数据多进程筛选（纯CPU计算，绕开GIL）
+        # Windows 上 ProcessPoolExecutor 最多 61 个进程，超过会 ValueError
+        processes = min(os.cpu_count() or 1, 61)
+        print(f"\n开始筛选（{processes}进程并行）...")
         reversal_results = []
         volume_results = []
         shrink_results = []
         total = len(stocks)
-        completed = 0
 
         strategy_names = {
             'reversal': '三日反转',
@@ -237,31 +392,29 @@ class CombinedScreener:
             'shrink_breakout': '缩量突破',
         }
 
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {executor.submit(self.screen_single_stock, stock): stock for stock in stocks}
-
-            for future in as_completed(futures):
-                completed += 1
-                if completed % 200 == 0:
-                    print(f"进度: {completed}/{total} ({completed * 100 // total}%)")
-                try:
-                    result = future.result()
-                    if result:
-                        stock = futures[future]
-                        hits = []
-                        if 'reversal' in result:
-                            reversal_results.append(result['reversal'])
-                            hits.append('三日反转')
-                        if 'volume_breakout' in result:
-                            volume_results.append(result['volume_breakout'])
-                            hits.append('放量突破')
-                        if 'shrink_breakout' in result:
-                            shrink_results.append(result['shrink_breakout'])
-                            hits.append('缩量突破')
-                        if hits:
-                            print(f"  命中: {stock['code']} {stock['name']} [{', '.join(hits)}]")
-                except Exception:
-                    pass
+        screen_stocks = [s for s in stocks if s['code'] in df_map]
+        with ProcessPoolExecutor(max_workers=processes,
+                                 initializer=_init_analysis_worker) as executor:
+            results = executor.map(
+                _analyze_only,
+                screen_stocks,
+                (df_map[s['code']] for s in screen_stocks),
+                chunksize=32,
+            )
+            for stock, result in tqdm(results, total=len(screen_stocks), desc="策略筛选", mininterval=1.0):
+                if result:
+                    hits = []
+                    if 'reversal' in result:
+                        reversal_results.append(result['reversal'])
+                        hits.append('三日反转')
+                    if 'volume_breakout' in result:
+                        volume_results.append(result['volume_breakout'])
+                        hits.append('放量突破')
+                    if 'shrink_breakout' in result:
+                        shrink_results.append(result['shrink_breakout'])
+                        hits.append('缩量突破')
+                    if hits:
+                        tqdm.write(f"  命中: {stock['code']} {stock['name']} [{', '.join(hits)}]")
 
         # 按评分排序
         reversal_results.sort(key=lambda x: x.get('score', 0), reverse=True)
@@ -289,13 +442,13 @@ class CombinedScreener:
         if reversal_results:
             df_out = pd.DataFrame(reversal_results)
             f = f"D:/stock_pattern_{timestamp}.csv"
-            df_out.to_csv(f, index=False, encoding='utf-8-sig')
+            _write_csv(df_out, f)
             csv_files['reversal'] = f
 
         if volume_results:
             df_out = pd.DataFrame(volume_results)
             f = f"D:/consolidation_breakout_{timestamp}.csv"
-            df_out.to_csv(f, index=False, encoding='utf-8-sig')
+            _write_csv(df_out, f)
             csv_files['volume'] = f
 
         if shrink_results:
@@ -317,7 +470,7 @@ class CombinedScreener:
             }
             output_df = output_df.rename(columns=col_map)
             f = f"D:/stock_consolidation_breakout_{timestamp}.csv"
-            output_df.to_csv(f, index=False, encoding='utf-8-sig')
+            _write_csv(output_df, f)
             csv_files['shrink'] = f
 
         # 输出汇总报告
@@ -328,183 +481,175 @@ class CombinedScreener:
 
     def _print_report(self, reversal_results, volume_results, shrink_results,
                       csv_files, total_scanned, elapsed):
-        """输出汇总报告"""
+        """输出汇总报告（先拼接全部行，最后一次性写出终端）"""
+        lines = []
 
         # === 交叉验证：找出被多个策略命中的股票 ===
-        hit_map = {}  # code -> {'name': ..., 'strategies': [...], 'scores': {...}}
-        for r in reversal_results:
-            code = r['code']
-            if code not in hit_map:
-                hit_map[code] = {'name': r['name'], 'strategies': [], 'scores': {}}
-            hit_map[code]['strategies'].append('三日反转')
-            hit_map[code]['scores']['三日反转'] = r.get('score', 0)
-        for r in volume_results:
-            code = r['code']
-            if code not in hit_map:
-                hit_map[code] = {'name': r['name'], 'strategies': [], 'scores': {}}
-            hit_map[code]['strategies'].append('放量突破')
-            hit_map[code]['scores']['放量突破'] = r.get('score', 0)
-        for r in shrink_results:
-            code = r['code']
-            if code not in hit_map:
-                hit_map[code] = {'name': r['name'], 'strategies': [], 'scores': {}}
-            hit_map[code]['strategies'].append('缩量突破')
-            hit_map[code]['scores']['缩量突破'] = r.get('score', 0)
-
-        multi_hit = {k: v for k, v in hit_map.items() if len(v['strategies']) >= 2}
+        cols = ['code', 'name', 'score']
+        df_all = pd.concat([
+            pd.DataFrame(reversal_results, columns=cols).assign(strategy='三日反转'),
+            pd.DataFrame(volume_results, columns=cols).assign(strategy='放量突破'),
+            pd.DataFrame(shrink_results, columns=cols).assign(strategy='缩量突破'),
+        ], ignore_index=True)
+        df_all['score'] = df_all['score'].fillna(0)
+
+        # code -> name / strategies / scores（sort=False 保持首次命中顺序）
+        hit_map = df_all.groupby('code', sort=False).agg(
+            name=('name', 'first'), strategies=('strategy', list), scores=('score', list)
+        )
+        hit_counts = hit_map['strategies'].str.len()
+        multi_hit = hit_map[hit_counts >= 2]
 
         # === 报告输出 ===
-        print("\n")
-        print("=" * 70)
-        print("  A股多策略选股 - 筛选报告")
-        print("=" * 70)
+        lines.append("\n")
+        lines.append("=" * 70)
+        lines.append("  A股多策略选股 - 筛选报告")
+        lines.append("=" * 70)
 
         # 总览
-        print(f"\n总览（扫描 {total_scanned} 只，耗时 {elapsed:.1f}秒）")
-        print("-" * 50)
-        print(f"{'策略':<16} {'命中数':<10}")
-        print("-" * 50)
-        print(f"{'三日反转':<16} {len(reversal_results):<10}")
-        print(f"{'放量突破':<16} {len(volume_results):<10}")
-        print(f"{'缩量突破':<16} {len(shrink_results):<10}")
+        lines.append(f"\n总览（扫描 {total_scanned} 只，耗时 {elapsed:.1f}秒）")
+        lines.append("-" * 50)
+        lines.append(f"{'策略':<16} {'命中数':<10}")
+        lines.append("-" * 50)
+        lines.append(f"{'三日反转':<16} {len(reversal_results):<10}")
+        lines.append(f"{'放量突破':<16} {len(volume_results):<10}")
+        lines.append(f"{'缩量突破':<16} {len(shrink_results):<10}")
         total_hits = len(reversal_results) + len(volume_results) + len(shrink_results)
-        print(f"{'合计（含重复）':<16} {total_hits:<10}")
-        print(f"{'独立股票数':<16} {len(hit_map):<10}")
-        print("-" * 50)
+        lines.append(f"{'合计（含重复）':<16} {total_hits:<10}")
+        lines.append(f"{'独立股票数':<16} {len(hit_map):<10}")
+        lines.append("-" * 50)
 
         # 多策略共振
-        if multi_hit:
-            print(f"\n多策略共振（同时被2+策略选中: {len(multi_hit)}只）")
-            print("-" * 70)
-            print(f"{'代码':<10} {'名称':<10} {'命中策略':<24} {'各策略评分':<20}")
-            print("-" * 70)
-            for code, info in sorted(multi_hit.items(), key=lambda x: len(x[1]['strategies']), reverse=True):
+        if len(multi_hit) > 0:
+            lines.append(f"\n多策略共振（同时被2+策略选中: {len(multi_hit)}只）")
+            lines.append("-" * 70)
+            lines.append(f"{'代码':<10} {'名称':<10} {'命中策略':<24} {'各策略评分':<20}")
+            lines.append("-" * 70)
+            multi_sorted = multi_hit.sort_values(
+                'strategies', key=lambda col: col.str.len(), ascending=False, kind='stable'
+            )
+            for code, info in multi_sorted.iterrows():
                 strategies = ', '.join(info['strategies'])
-                scores = ', '.join(f"{s}:{info['scores'][s]}" for s in info['strategies'])
-                print(f"{code:<10} {info['name']:<10} {strategies:<24} {scores:<20}")
-            print("-" * 70)
+                scores = ', '.join(f"{s}:{sc}" for s, sc in zip(info['strategies'], info['scores']))
+                lines.append(f"{code:<10} {info['name']:<10} {strategies:<24} {scores:<20}")
+            lines.append("-" * 70)
         else:
-            print("\n多策略共振: 无（今日无股票被多个策略同时选中）")
+            lines.append("\n多策略共振: 无（今日无股票被多个策略同时选中）")
 
         # 分策略详细结果
         # 策略1: 三日反转
-        print(f"\n{'='*70}")
-        print(f"策略一: 三日反转形态（命中 {len(reversal_results)} 只）")
-        print(f"形态: 小阴线 + 大阴线 + 低开高收阳线")
-        print(f"{'='*70}")
+        lines.append(f"\n{'='*70}")
+        lines.append(f"策略一: 三日反转形态（命中 {len(reversal_results)} 只）")
+        lines.append(f"形态: 小阴线 + 大阴线 + 低开高收阳线")
+        lines.append(f"{'='*70}")
         if reversal_results:
-            print(f"{'代码':<10} {'名称':<10} {'前置跌幅':<10} {'三日形态':<32} {'对比度':<8} {'上影线':<8} {'评分':<6}")
-            print("-" * 90)
+            lines.append(f"{'代码':<10} {'名称':<10} {'前置跌幅':<10} {'三日形态':<32} {'对比度':<8} {'上影线':<8} {'评分':<6}")
+            lines.append("-" * 90)
             for r in reversal_results:
                 pattern_str = f"{r['day1_change']:+.1f}% > {r['day2_change']:+.1f}% > {r['day3_change']:+.1f}%"
                 contrast = f"{r['contrast']:.1f}x"
                 shadow = f"{r['shadow']:.0f}%"
                 prior = f"{r['prior_decline']:+.1f}%"
-                print(f"{r['code']:<10} {r['name']:<10} {prior:<10} {pattern_str:<32} {contrast:<8} {shadow:<8} {r['score']:<6}")
+                lines.append(f"{r['code']:<10} {r['name']:<10} {prior:<10} {pattern_str:<32} {contrast:<8} {shadow:<8} {r['score']:<6}")
         else:
-            print("今日无命中")
+            lines.append("今日无命中")
 
         # 策略2: 放量突破
-        print(f"\n{'='*70}")
-        print(f"策略二: 放量突破形态（命中 {len(volume_results)} 只）")
-        print(f"形态: 前期下跌 > 止跌横盘 > 涨停板 > 回踩横盘 > 放量突破")
-        print(f"{'='*70}")
+        lines.append(f"\n{'='*70}")
+        lines.append(f"策略二: 放量突破形态（命中 {len(volume_results)} 只）")
+        lines.append(f"形态: 前期下跌 > 止跌横盘 > 涨停板 > 回踩横盘 > 放量突破")
+        lines.append(f"{'='*70}")
         if volume_results:
-            print(f"{'代码':<10} {'名称':<10} {'涨停日期':<12} {'涨停涨幅':<10} "
-                  f"{'回踩天数':<10} {'回踩振幅':<10} {'突破量比':<10} {'评分':<6}")
-            print("-" * 90)
+            lines.append(f"{'代码':<10} {'名称':<10} {'涨停日期':<12} {'涨停涨幅':<10} "
+                         f"{'回踩天数':<10} {'回踩振幅':<10} {'突破量比':<10} {'评分':<6}")
+            lines.append("-" * 90)
             for r in volume_results:
-                print(f"{r['code']:<10} {r['name']:<10} {r['limit_up_date']:<12} "
-                      f"{r['limit_up_change']:>+.1f}%{'':>4} "
-                      f"{r['post_consol_days']}天{'':>6} "
-                      f"{r['post_range_pct']:.1f}%{'':>6} "
-                      f"{r['break_vol_ratio']:.2f}x{'':>5} "
-                      f"{r['score']:<6}")
+                lines.append(f"{r['code']:<10} {r['name']:<10} {r['limit_up_date']:<12} "
+                             f"{r['limit_up_change']:>+.1f}%{'':>4} "
+                             f"{r['post_consol_days']}天{'':>6} "
+                             f"{r['post_range_pct']:.1f}%{'':>6} "
+                             f"{r['break_vol_ratio']:.2f}x{'':>5} "
+                             f"{r['score']:<6}")
         else:
-            print("今日无命中")
+            lines.append("今日无命中")
 
         # 策略3: 缩量突破
-        print(f"\n{'='*70}")
-        print(f"策略三: 缩量突破形态（命中 {len(shrink_results)} 只）")
-        print(f"形态: 下跌 > 横盘 > 涨停 > 横盘 > 缩量突破")
-        print(f"{'='*70}")
+        lines.append(f"\n{'='*70}")
+        lines.append(f"策略三: 缩量突破形态（命中 {len(shrink_results)} 只）")
+        lines.append(f"形态: 下跌 > 横盘 > 涨停 > 横盘 > 缩量突破")
+        lines.append(f"{'='*70}")
         if shrink_results:
-            print(f"{'代码':<10} {'名称':<10} {'前期跌幅':<10} {'横盘1天数':<10} "
-                  f"{'涨停日期':<14} {'涨停形态':<10} {'横盘2天数':<10} {'MA5/MA10':<10} {'评分':<6}")
-            print("-" * 100)
+            lines.append(f"{'代码':<10} {'名称':<10} {'前期跌幅':<10} {'横盘1天数':<10} "
+                         f"{'涨停日期':<14} {'涨停形态':<10} {'横盘2天数':<10} {'MA5/MA10':<10} {'评分':<6}")
+            lines.append("-" * 100)
             for r in shrink_results:
-                print(f"{r['code']:<10} {r['name']:<10} "
-                      f"{'-' + str(r['decline_pct']) + '%':<10} "
-                      f"{r['consolidation1_days']:<10} "
-                      f"{r['limit_up_date']:<14} "
-                      f"{r['limit_up_type']:<10} "
-                      f"{r['post_days']:<10} "
-                      f"{r['vol_ratio']:<10} "
-                      f"{r['score']:<6}")
+                lines.append(f"{r['code']:<10} {r['name']:<10} "
+                             f"{'-' + str(r['decline_pct']) + '%':<10} "
+                             f"{r['consolidation1_days']:<10} "
+                             f"{r['limit_up_date']:<14} "
+                             f"{r['limit_up_type']:<10} "
+                             f"{r['post_days']:<10} "
+                             f"{r['vol_ratio']:<10} "
+                             f"{r['score']:<6}")
         else:
-            print("今日无命中")
+            lines.append("今日无命中")
 
         # 综合推荐 Top 5
-        print(f"\n{'='*70}")
-        print("综合推荐 Top 5")
-        print(f"{'='*70}")
-        all_stocks = []
-        for r in reversal_results:
-            all_stocks.append({
-                'code': r['code'], 'name': r['name'],
-                'strategy': '三日反转', 'score': r.get('score', 0),
-                'multi_hit': r['code'] in multi_hit,
-                'hit_count': len(hit_map.get(r['code'], {}).get('strategies', [])),
-            })
-        for r in volume_results:
-            all_stocks.append({
-                'code': r['code'], 'name': r['name'],
-                'strategy': '放量突破', 'score': r.get('score', 0),
-                'multi_hit': r['code'] in multi_hit,
-                'hit_count': len(hit_map.get(r['code'], {}).get('strategies', [])),
-            })
-        for r in shrink_results:
-            all_stocks.append({
-                'code': r['code'], 'name': r['name'],
-                'strategy': '缩量突破', 'score': r.get('score', 0),
-                'multi_hit': r['code'] in multi_hit,
-                'hit_count': len(hit_map.get(r['code'], {}).get('strategies', [])),
-            })
-
+        lines.append(f"\n{'='*70}")
+        lines.append("综合推荐 Top 5")
+        lines.append(f"{'='*70}")
         # 去重（同一股票取最高分记录），多策略共振优先
-        seen = {}
-        for s in all_stocks:
-            code = s['code']
-            if code not in seen or s['score'] > seen[code]['score']:
-                seen[code] = s
-
-        ranked = sorted(seen.values(), key=lambda x: (x['hit_count'], x['score']), reverse=True)
-
-        if ranked:
-            for i, s in enumerate(ranked[:5], 1):
-                multi_tag = " [多策略共振]" if s['multi_hit'] else ""
-                strategies = ', '.join(hit_map[s['code']]['strategies'])
-                print(f"  {i}. {s['code']} {s['name']} - {strategies} (最高评分: {s['score']}){multi_tag}")
+        df_all['hit_count'] = df_all['code'].map(hit_counts)
+        ranked = (
+            df_all.loc[df_all.groupby('code', sort=False)['score'].idxmax()]
+            .sort_values(['hit_count', 'score'], ascending=False, kind='stable')
+        )
+
+        if len(ranked) > 0:
+            for i, (_, s) in enumerate(ranked.head(5).iterrows(), 1):
+                multi_tag = " [多策略共振]" if s['hit_count'] >= 2 else ""
+                strategies = ', '.join(hit_map.at[s['code'], 'strategies'])
+                lines.append(f"  {i}. {s['code']} {s['name']} - {strategies} (最高评分: {s['score']}){multi_tag}")
         else:
-            print("  今日无推荐")
+            lines.append("  今日无推荐")
 
         # CSV文件路径
-        print(f"\n{'='*70}")
-        print("结果文件")
-        print(f"{'='*70}")
+        lines.append(f"\n{'='*70}")
+        lines.append("结果文件")
+        lines.append(f"{'='*70}")
         if csv_files.get('reversal'):
-            print(f"  三日反转: {csv_files['reversal']}")
+            lines.append(f"  三日反转: {csv_files['reversal']}")
         if csv_files.get('volume'):
-            print(f"  放量突破: {csv_files['volume']}")
+            lines.append(f"  放量突破: {csv_files['volume']}")
         if csv_files.get('shrink'):
-            print(f"  缩量突破: {csv_files['shrink']}")
+            lines.append(f"  缩量突破: {csv_files['shrink']}")
         if not csv_files:
-            print("  今日无命中，未生成CSV文件")
+            lines.append("  今日无命中，未生成CSV文件")
 
         # 风险提示
-        print(f"\n{'='*70}")
-        print("风险提示: 本工具仅供学习研究使用，不构成任何投资建议。股市有风险，投资需谨慎。")
-        print(f"{'='*70}")
+        lines.append(f"\n{'='*70}")
+        lines.append("风险提示: 本工具仅供学习研究使用，不构成任何投资建议。股市有风险，投资需谨慎。")
+        lines.append(f"{'='*70}")
+
+        sys.stdout.write('\n'.join(lines) + '\n')
+
+
+# 分析子进程内的选股器实例（策略类为动态导入，无法随任务pickle，每个进程各自构建）
+_worker_screener = None
+
+
+def _init_analysis_worker():
+    """分析子进程初始化"""
+    global _worker_screener
+    _worker_screener = CombinedScreener()
+
+
+def _analyze_only(stock, df):
+    """子进程内对预取的K线运行三个策略"""
+    try:
+        return _worker_screener.screen_single_stock(stock, df)
+    except Exception:
+        return stock, None
 
 
 def main():
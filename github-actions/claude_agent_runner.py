@@ -11,8 +11,19 @@ import subprocess
 import sys
 import os
 import json
+import signal
+import threading
+from collections import deque
 from datetime import datetime
 
+# run_stock_screener 返回给 Claude 的输出摘要：开头/结尾保留的行数
+SCREENER_HEAD_LINES = 40
+SCREENER_TAIL_LINES = 200
+
+# 筛选脚本硬超时（秒）：须大于脚本自身的超时保护 max_elapsed=4200，
+# 留出保存结果的余量，同时小于 workflow 的 timeout-minutes: 90
+SCREENER_TIMEOUT = 4800
+
 
 # 定义 Tools
 TOOLS = [
@@ -57,6 +68,22 @@ SYSTEM_PROMPT = """你是一位专业的A股技术分析师，擅长通过K线
 注意：本分析仅供学习研究使用，不构成任何投资建议。"""
 
 
+# 进程组（setsid/killpg）仅POSIX可用；其他平台退化为只结束主进程
+_POSIX = os.name == 'posix'
+
+
+def _kill_process_group(proc, timed_out):
+    """超时回调：标记超时并结束筛选脚本及其全部子进程"""
+    timed_out.set()
+    try:
+        if _POSIX:
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except ProcessLookupError:
+        pass  # 进程组已退出
+
+
 def execute_tool(tool_name, tool_input):
     """执行工具调用"""
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -65,28 +92,54 @@ def execute_tool(tool_name, tool_input):
     if tool_name == "run_stock_screener":
         screener_script = os.path.join(script_dir, 'combined_screener_cloud.py')
         print("  正在执行筛选脚本...")
-        result = subprocess.run(
+        proc = subprocess.Popen(
             [sys.executable, screener_script],
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
+            bufsize=1,
             env={**os.environ, 'OUTPUT_DIR': output_dir},
-            timeout=3600  # 串行遍历可能需要较长时间
+            start_new_session=_POSIX,  # 独立进程组，超时时连同 multiprocessing 子进程一起结束
         )
-        output = result.stdout
-        if result.stderr:
-            output += f"\n[stderr]: {result.stderr}"
-        # 截取最后部分避免输出过长
-        if len(output) > 10000:
-            output = output[:2000] + "\n...[中间省略]...\n" + output[-8000:]
+        # 超时保护：子进程继承了stdout管道，只kill主进程时读取循环仍会阻塞，须杀整个进程组
+        timed_out = threading.Event()
+        timer = threading.Timer(SCREENER_TIMEOUT, _kill_process_group, args=(proc, timed_out))
+        timer.start()
+
+        # 边读边转发到控制台，只保留开头和结尾若干行（内存占用恒定）
+        head = []
+        tail = deque(maxlen=SCREENER_TAIL_LINES)
+        omitted = 0
+        try:
+            for line in proc.stdout:
+                sys.stdout.write(line)
+                if len(head) < SCREENER_HEAD_LINES:
+                    head.append(line)
+                else:
+                    if len(tail) == tail.maxlen:
+                        omitted += 1
+                    tail.append(line)
+            proc.wait()
+        finally:
+            timer.cancel()
+
+        if omitted:
+            output = ''.join(head) + f"\n...[中间省略 {omitted} 行]...\n" + ''.join(tail)
+        else:
+            output = ''.join(head) + ''.join(tail)
+        if timed_out.is_set():
+            # 明确告知Agent本次运行被强制终止，避免把中断的输出当作正常结果
+            output += (f"\n[错误] 筛选脚本运行超过 {SCREENER_TIMEOUT} 秒被强制终止，"
+                       "未正常完成，latest_results.json 可能缺失或来自上一次运行。\n")
         return output
 
     elif tool_name == "read_screening_results":
         results_file = os.path.join(output_dir, 'latest_results.json')
         if not os.path.exists(results_file):
             return json.dumps({"error": "筛选结果文件不存在，请先运行 run_stock_screener"})
+        # 筛选脚本写入的已是缩进格式的JSON，直接读取文本，无需解析后再序列化
         with open(results_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        result_json = json.dumps(data, ensure_ascii=False, indent=2)
+            result_json = f.read()
         # 防止超长
         if len(result_json) > 50000:
             result_json = result_json[:50000] + "\n...[数据截断]"
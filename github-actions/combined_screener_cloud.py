@@ -1,26 +1,208 @@
 """
 A股三合一多策略选股器 - GitHub Actions 云端版本
 策略: 三日反转 | 放量突破 | 缩量突破
-数据源: BaoStock (全市场股票列表 + 日K线) + 新浪财经 (最新名称)
+数据源: BaoStock (全市场股票列表) + 东方财富/BaoStock (日K线) + 新浪财经 (最新名称)
 """
 
 import baostock as bs
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+import multiprocessing as mp
+from multiprocessing.util import Finalize
+from collections import defaultdict
+from itertools import chain
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from functools import cached_property
+from datetime import datetime, timedelta, timezone
 import urllib.request
 import re
+import threading
 import warnings
 import time
 import os
 import sys
 import json
 
+try:
+    import orjson
+
+    def _dumps_json(obj):
+        """orjson C编码器直接输出UTF-8字节（结果中含numpy标量，需OPT_SERIALIZE_NUMPY）"""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+except ImportError:
+    def _dumps_json(obj):
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
 # 确保输出不被缓冲（GitHub Actions 环境）
 if not sys.stdout.line_buffering:
     sys.stdout.reconfigure(line_buffering=True)
 
 warnings.filterwarnings('ignore')
 
+# 新浪行情: var hq_str_sh600000="浦发银行,...";（GBK字节中逗号/引号不会出现在双字节内）
+_SINA_RE = re.compile(rb'hq_str_(\w+)="([^,"]+)')
+
+# A股交易时间按北京时间判断（CI runner 为UTC）；收盘后留半小时等待日K线定格
+_BEIJING_TZ = timezone(timedelta(hours=8))
+_SESSION_SETTLED = (15, 30)
+
+# 单只股票命中标志位（screen_single_stock_flags 返回值的第一项）
+HIT_REVERSAL = 1
+HIT_VOLUME_BREAKOUT = 2
+HIT_SHRINK_BREAKOUT = 4
+
+# 各策略CSV列（与命中结果dict的键顺序一致：code/name + check_pattern详情）
+_REVERSAL_COLUMNS = (
+    'code', 'name', 'day1_change', 'day2_change', 'day3_change', 'gap_down', 'day2_gap',
+    'contrast', 'shadow', 'engulfed', 'prior_decline', 'day1_date', 'day2_date', 'day3_date',
+    'score',
+)
+_VOLUME_BREAKOUT_COLUMNS = (
+    'code', 'name', 'prior_decline_pct', 'consol_days', 'consol_range_pct', 'consol_mean_price',
+    'limit_up_date', 'limit_up_change', 'limit_up_body_ratio', 'limit_up_vol_ratio',
+    'post_consol_days', 'post_range_pct', 'break_date', 'break_change', 'break_vol_ratio',
+    'break_body_ratio', 'break_close', 'score',
+)
+_SHRINK_BREAKOUT_COLUMNS = (
+    'code', 'name', 'signal_change', 'vol_ma_short', 'vol_ma_long', 'vol_ratio', 'signal_date',
+    'post_days', 'post_amplitude', 'post_max_close', 'post_min_close', 'consolidation1_start',
+    'consolidation1_days', 'consolidation1_amplitude', 'decline_pct', 'limit_up_date',
+    'limit_up_change', 'limit_up_type', 'score',
+)
+
+
+# Markdown各策略表格列定义：(表头, 分隔线宽度, 单元格模板)，导入时拼成表头与行模板
+def _table_templates(schema):
+    """由列定义生成 (表头+分隔线, 行模板)，行模板供format_map直接按命中结果dict取字段"""
+    header = "| " + " | ".join(title for title, _, _ in schema) + " |\n"
+    divider = "|" + "|".join("-" * width for _, width, _ in schema) + "|\n"
+    row = "| " + " | ".join(cell for _, _, cell in schema) + " |\n"
+    return header + divider, row
+
+
+_REVERSAL_HEAD, _REVERSAL_ROW = _table_templates((
+    ('代码', 6, '{code}'),
+    ('名称', 6, '{name}'),
+    ('前置跌幅', 10, '{prior_decline:+.1f}%'),
+    ('三日形态', 10, '{day1_change:+.1f}% → {day2_change:+.1f}% → {day3_change:+.1f}%'),
+    ('D2跳空', 8, '{d2_gap}'),
+    ('评分', 6, '{score}'),
+))
+_VOLUME_BREAKOUT_HEAD, _VOLUME_BREAKOUT_ROW = _table_templates((
+    ('代码', 6, '{code}'),
+    ('名称', 6, '{name}'),
+    ('涨停日期', 10, '{limit_up_date}'),
+    ('回踩天数', 10, '{post_consol_days}天'),
+    ('突破量比', 10, '{break_vol_ratio:.2f}x'),
+    ('评分', 6, '{score}'),
+))
+_SHRINK_BREAKOUT_HEAD, _SHRINK_BREAKOUT_ROW = _table_templates((
+    ('代码', 6, '{code}'),
+    ('名称', 6, '{name}'),
+    ('涨停日期', 10, '{limit_up_date}'),
+    ('涨停形态', 10, '{limit_up_type}'),
+    ('MA5/MA10', 10, '{vol_ratio:.4f}'),
+    ('评分', 6, '{score}'),
+))
+
+
+def _write_csv(results, path, columns):
+    """记录列表写出为带BOM的UTF-8 CSV（Excel直接打开中文不乱码），优先使用pyarrow的C++写入器
+
+    按已知列逐列收集（而非逐行检查dict键），列顺序由 columns 决定；
+    个别记录缺列时写空值（与 pd.DataFrame(results) 一致），不中断后续JSON/Markdown保存。
+    注意两种写入器格式不同：pyarrow 表头和字符串带引号、布尔写 true/false、1.0 写作 1；
+    pandas 仅必要时加引号、布尔写 True/False（解析结果相同）
+    """
+    data = {c: [r.get(c) for r in results] for c in columns}
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+        table = pa.Table.from_pydict(data)
+    except Exception:
+        # 未安装pyarrow或存在混合类型列时，退回pandas写入器
+        pd.DataFrame(data).to_csv(path, index=False, encoding='utf-8-sig')
+        return
+    with open(path, 'wb') as f:
+        f.write(b'\xef\xbb\xbf')
+        pacsv.write_csv(table, f)
+
+
+def _write_atomic(path, data):
+    """先写同目录临时文件再os.replace替换，崩溃时不会留下写了一半的文件"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _prune_daily_cache(cache_dir, prefix, keep_path):
+    """删除 cache_dir 下 prefix 开头的往日缓存文件，只保留 keep_path（按日命名的缓存不会无限累积）"""
+    keep = os.path.basename(keep_path)
+    try:
+        for entry in os.scandir(cache_dir):
+            if entry.is_file() and entry.name.startswith(prefix) and entry.name != keep:
+                os.remove(entry.path)
+    except Exception:
+        pass  # 清理失败不影响筛选
+
+
+def _fetch_sina(url):
+    """请求一批新浪行情（原始GBK字节）"""
+    req = urllib.request.Request(url, headers={'Referer': 'http://finance.sina.com.cn'})
+    with urllib.request.urlopen(req, timeout=10) as response:
+        return response.read()
+
+
+@dataclass
+class StockArrays:
+    """单只股票的日K线列数组（按日期升序），策略层只按位置访问"""
+    date: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    @classmethod
+    def from_frame(cls, df):
+        # 价格保持float64：涨停/上影线等阈值常落在0.01价位精确比值上，float32会改变判定
+        return cls(
+            date=df['date'].to_numpy(),
+            open=df['open'].to_numpy(dtype=np.float64),
+            high=df['high'].to_numpy(dtype=np.float64),
+            low=df['low'].to_numpy(dtype=np.float64),
+            close=df['close'].to_numpy(dtype=np.float64),
+            volume=df['volume'].to_numpy(dtype=np.int64),
+        )
+
+    def __len__(self):
+        return len(self.close)
+
+    def to_frame(self):
+        return pd.DataFrame({f.name: getattr(self, f.name) for f in fields(self)})
+
+    def tail(self, n):
+        # n<=0 时返回空数组（arr[-0:] 会取到整个数组）
+        start = len(self) - n if n > 0 else len(self)
+        return StockArrays(*(getattr(self, f.name)[max(start, 0):] for f in fields(self)))
+
+    def append(self, other):
+        return StockArrays(*(np.concatenate((getattr(self, f.name), getattr(other, f.name)))
+                             for f in fields(self)))
+
+    # ---- 多个策略共用的派生序列：首次访问时计算，同一只股票内复用 ----
+
+    @cached_property
+    def pct_change(self):
+        """逐日涨跌幅(%)，pct_change[j] 为第 j+1 日相对第 j 日；前收盘为0时为NaN"""
+        prev_close = self.close[:-1]
+        valid = prev_close != 0
+        pct = (self.close[1:] - prev_close) / np.where(valid, prev_close, 1.0) * 100
+        return np.where(valid, pct, np.nan)
+
 
 class CombinedScreenerCloud:
     """三合一多策略选股器（云端版）"""
@@ -28,6 +210,13 @@ class CombinedScreenerCloud:
     def __init__(self):
         self.bs_logged_in = False
         self.history_days = 200  # 取三个策略中最大值（放量突破需要200天）
+        # 并发进程数（每进程一个BaoStock会话，过多会触发限流），可用 SCREEN_WORKERS 覆盖
+        self.max_workers = int(os.environ.get('SCREEN_WORKERS', 10))
+        self.cache_dir = os.environ.get('CACHE_DIR', 'cache')  # 当日K线缓存目录
+        # K线优先走东方财富HTTP接口，连续失败达到阈值后本进程改用BaoStock
+        self.eastmoney_kline = os.environ.get('KLINE_SOURCE', 'eastmoney') == 'eastmoney'
+        self.eastmoney_max_failures = 3
+        self._eastmoney_failures = 0
 
         # 策略1: 三日反转 配置
         self.reversal_config = {
@@ -89,8 +278,18 @@ class CombinedScreenerCloud:
             self.bs_logged_in = False
 
     def get_stock_list(self):
-        """BaoStock获取全市场股票，排除ST/科创板/北交所"""
+        """BaoStock获取全市场股票，排除ST/科创板/北交所（当日结果缓存为parquet）"""
         print("正在获取A股列表...")
+        day = datetime.now().strftime('%Y%m%d')
+        cache_path = os.path.join(self.cache_dir, f'stock_list_{day}.parquet')
+        if os.path.exists(cache_path):
+            try:
+                stocks = pd.read_parquet(cache_path, engine='pyarrow').to_dict('records')
+                print(f"共获取 {len(stocks)} 只股票（当日缓存）")
+                return stocks
+            except Exception:
+                pass  # 缓存损坏时重新拉取
+
         try:
             rs = bs.query_stock_basic()
             stocks = []
@@ -117,16 +316,163 @@ class CombinedScreenerCloud:
                     })
 
             print(f"共获取 {len(stocks)} 只股票")
+            if stocks:
+                try:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    pd.DataFrame(stocks).to_parquet(cache_path, engine='pyarrow', index=False)
+                    _prune_daily_cache(self.cache_dir, 'stock_list_', cache_path)
+                except Exception:
+                    pass  # 缓存写入失败不影响筛选
             return stocks
         except Exception as e:
             print(f"获取股票列表失败: {e}")
             return []
 
+    def _history_cache_path(self, bs_code):
+        """K线持久缓存路径: cache/hist/sh.600000.parquet"""
+        return os.path.join(self.cache_dir, 'hist', f'{bs_code}.parquet')
+
     def get_stock_history(self, bs_code):
-        """BaoStock获取前复权日K线（200交易日）"""
+        """获取前复权日K线（200交易日），本地parquet缓存增量更新
+
+        - 缓存写于今日收盘定格之后: 直接使用
+        - 其他情况: 从倒数第二根缓存K线起增量拉取，最后一根（可能是盘中写入的未收盘K线）总会被刷新
+        - 无缓存/复权价变动: 全量拉取
+        数据源优先东方财富，失败时降级BaoStock。
+        返回 StockArrays 列数组，数据不足或获取失败返回 None
+        """
+        cache_path = self._history_cache_path(bs_code)
+        cached = None
+        if os.path.exists(cache_path):
+            try:
+                df = pd.read_parquet(cache_path, engine='pyarrow',
+                                     columns=['date', 'open', 'high', 'low', 'close', 'volume'])
+                cached = StockArrays.from_frame(df.drop_duplicates('date', keep='last'))
+                if self._history_cache_settled(os.path.getmtime(cache_path)):
+                    return cached.tail(self.history_days)
+            except Exception:
+                cached = None  # 缓存损坏时重新拉取
+
+        arrs = None
+        if cached is not None and len(cached) >= 2:
+            arrs = self._update_history(bs_code, cached)
+            if arrs is cached:
+                # 没有新K线且最后一根未变（周末/节假日）：缓存内容不变，只刷新mtime
+                try:
+                    os.utime(cache_path)
+                except Exception:
+                    pass
+                return arrs.tail(self.history_days)
+        if arrs is None:
+            arrs = self._fetch_history(bs_code)
+        if arrs is None:
+            return None
+
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            arrs.to_frame().to_parquet(cache_path, engine='pyarrow', index=False)
+        except Exception:
+            pass  # 缓存写入失败不影响筛选
+
+        return arrs
+
+    @staticmethod
+    def _history_cache_settled(mtime):
+        """缓存是否写于当天（北京时间）收盘定格之后：此时其中的K线均已收盘，无需重新拉取"""
+        written = datetime.fromtimestamp(mtime, _BEIJING_TZ)
+        now = datetime.now(_BEIJING_TZ)
+        return written.date() == now.date() and (written.hour, written.minute) >= _SESSION_SETTLED
+
+    def _update_history(self, bs_code, cached):
+        """从倒数第二根缓存K线（含）起增量拉取，替换最后一根并拼接新K线
+
+        倒数第二根作为重叠校验（已收盘）：收盘价不一致说明复权价已变，返回None触发全量。
+        最后一根可能是盘中写入的未收盘K线，总以新数据为准。
+        没有新K线且最后一根未变时原样返回 cached（调用方据此跳过缓存写入）
+        """
+        check_date = str(cached.date[-2])
+        new = self._fetch_history(bs_code, start_date=check_date)
+        # 收盘价按分比较，避免东方财富/BaoStock两个数据源的浮点噪声触发不必要的全量拉取
+        if (new is None or str(new.date[0]) != check_date
+                or round(new.close[0], 2) != round(cached.close[-2], 2)):
+            return None
+        # 只取校验日之后的K线（防御性剔除重复日期）
+        fresh = new.date.astype(str) > check_date
+        if not fresh.any():
+            return None  # 数据源缺少最后一根缓存K线，全量重建
+        new = StockArrays(*(getattr(new, f.name)[fresh] for f in fields(new)))
+        last = cached.tail(1)
+        if len(new) == 1 and all(np.array_equal(getattr(new, f.name), getattr(last, f.name))
+                                 for f in fields(new)):
+            return cached
+        settled = StockArrays(*(getattr(cached, f.name)[:-1] for f in fields(cached)))
+        return settled.append(new).tail(self.history_days)
+
+    def _fetch_history(self, bs_code, start_date=None):
+        """按数据源优先级拉取K线；start_date为None时全量拉取history_days根"""
+        arrs = None
+        if self.eastmoney_kline and self._eastmoney_failures < self.eastmoney_max_failures:
+            arrs = self._fetch_history_eastmoney(bs_code, start_date)
+        if arrs is None:
+            arrs = self._fetch_history_baostock(bs_code, start_date)
+        return arrs
+
+    def _fetch_history_eastmoney(self, bs_code, start_date=None):
+        """东方财富push2his接口获取前复权日K线（单次HTTP请求，无需会话）"""
+        market = '1' if bs_code.startswith('sh') else '0'
+        beg = start_date.replace('-', '') if start_date else '0'
+        url = ("https://push2his.eastmoney.com/api/qt/stock/kline/get?"
+               f"secid={market}.{bs_code[3:]}&"
+               "ut=fa5fd1943c7b386f172d6893dbfba10b&"
+               "fields1=f1,f2,f3&fields2=f51,f52,f53,f54,f55,f56&"
+               f"klt=101&fqt=1&beg={beg}&end=20500101&lmt={self.history_days}")
+        # f51=日期, f52=开盘, f53=收盘, f54=最高, f55=最低, f56=成交量(手)
+
+        try:
+            req = urllib.request.Request(url, headers={
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            })
+            with urllib.request.urlopen(req, timeout=10) as response:
+                data = json.loads(response.read().decode('utf-8'))
+        except Exception:
+            self._eastmoney_failures += 1
+            return None
+        self._eastmoney_failures = 0
+
+        klines = (data.get('data') or {}).get('klines') or []
+        dates, opens, highs, lows, closes, volumes = [], [], [], [], [], []
+        for line in klines:
+            try:
+                d, o, c, h, l, v = line.split(',')[:6]
+                row = (float(o), float(h), float(l), float(c), float(v) * 100)  # 手 → 股，与BaoStock一致
+            except ValueError:
+                continue
+            dates.append(d)
+            opens.append(row[0])
+            highs.append(row[1])
+            lows.append(row[2])
+            closes.append(row[3])
+            volumes.append(row[4])
+
+        if len(dates) < (30 if start_date is None else 1):
+            return None
+
+        return StockArrays(
+            date=np.array(dates, dtype=object),
+            open=np.array(opens, dtype=np.float64),
+            high=np.array(highs, dtype=np.float64),
+            low=np.array(lows, dtype=np.float64),
+            close=np.array(closes, dtype=np.float64),
+            volume=np.array(volumes, dtype=np.float64).astype(np.int64),
+        )
+
+    def _fetch_history_baostock(self, bs_code, start_date=None):
+        """BaoStock获取前复权日K线（需已登录会话）"""
+        min_rows = 30 if start_date is None else 1
         try:
             end_date = datetime.now().strftime('%Y-%m-%d')
-            start_date = (datetime.now() - timedelta(days=self.history_days * 2)).strftime('%Y-%m-%d')
+            if start_date is None:
+                start_date = (datetime.now() - timedelta(days=self.history_days * 2)).strftime('%Y-%m-%d')
 
             rs = bs.query_history_k_data_plus(
                 bs_code,
@@ -140,29 +486,66 @@ class CombinedScreenerCloud:
             if rs.error_code != '0':
                 return None
 
-            data_list = []
+            # rs.get_data() 内部同样逐行next()，还会多建一个DataFrame；这里只收集原始行
+            rows = []
             while rs.next():
-                data_list.append(rs.get_row_data())
+                rows.append(rs.get_row_data())
 
-            if len(data_list) < 30:
+            if len(rows) < min_rows:
                 return None
 
-            df = pd.DataFrame(data_list, columns=['date', 'open', 'high', 'low', 'close', 'volume'])
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            df = df.dropna()
-
-            if len(df) < 30:
+            # 一次性向量化转换；停牌等空字段或非数字字段记为NaN后整行剔除（等价于dropna），
+            # 单行脏数据只丢该行，不会让整只股票的K线转换失败
+            raw = np.array(rows, dtype=str)
+            values = pd.to_numeric(raw[:, 1:].ravel(), errors='coerce').reshape(len(raw), -1)
+            valid = ~np.isnan(values).any(axis=1)
+            if valid.sum() < min_rows:
                 return None
 
-            return df.tail(self.history_days).reset_index(drop=True)
+            dates = raw[valid, 0].astype(object)[-self.history_days:]
+            values = values[valid][-self.history_days:]
+            return StockArrays(
+                date=dates,
+                open=values[:, 0].copy(),
+                high=values[:, 1].copy(),
+                low=values[:, 2].copy(),
+                close=values[:, 3].copy(),
+                volume=values[:, 4].astype(np.int64),
+            )
         except Exception:
             return None
 
     def get_latest_names(self, codes):
-        """新浪财经API获取最新名称（失败时降级用BaoStock名称）"""
+        """新浪财经API获取最新名称（失败时降级用BaoStock名称），当日结果缓存为JSON"""
         if not codes:
             return {}
+
+        day = datetime.now().strftime('%Y%m%d')
+        cache_path = os.path.join(self.cache_dir, f'names_{day}.json')
+        cached = {}
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+            except Exception:
+                cached = {}  # 缓存损坏时重新拉取
+
+        missing = [c for c in codes if c not in cached]
+        if missing:
+            fetched = self._fetch_latest_names(missing)
+            if fetched:
+                cached.update(fetched)
+                try:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    _write_atomic(cache_path, json.dumps(cached, ensure_ascii=False).encode('utf-8'))
+                    _prune_daily_cache(self.cache_dir, 'names_', cache_path)
+                except Exception:
+                    pass  # 缓存写入失败不影响结果
+
+        return {c: cached[c] for c in codes if c in cached}
+
+    def _fetch_latest_names(self, codes):
+        """新浪财经批量查询名称，返回 {code: name}"""
         name_map = {}
         try:
             sina_codes = []
@@ -171,26 +554,32 @@ class CombinedScreenerCloud:
                 sina_codes.append(f'{prefix}{code}')
 
             batch_size = 100
-            for i in range(0, len(sina_codes), batch_size):
-                batch = sina_codes[i:i+batch_size]
-                url = 'http://hq.sinajs.cn/list=' + ','.join(batch)
-                req = urllib.request.Request(url, headers={'Referer': 'http://finance.sina.com.cn'})
-                response = urllib.request.urlopen(req, timeout=10)
-                content = response.read().decode('gbk')
-
-                for line in content.strip().split('\n'):
-                    match = re.search(r'hq_str_(\w+)="([^,]+)', line)
-                    if match:
-                        sina_code = match.group(1)
-                        name = match.group(2)
-                        pure_code = sina_code[2:]
-                        name_map[pure_code] = name
+            urls = ['http://hq.sinajs.cn/list=' + ','.join(sina_codes[i:i+batch_size])
+                    for i in range(0, len(sina_codes), batch_size)]
+
+            # 各批次请求互不依赖，线程池并发拉取；单批失败只丢失该批名称
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                futures = [executor.submit(_fetch_sina, url) for url in urls]
+                failed = 0
+                for future in futures:
+                    try:
+                        content = future.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"获取最新名称失败（{failed}/{len(urls)} 批）: {e}")
+                        continue
+                    for match in _SINA_RE.finditer(content):
+                        pure_code = match.group(1)[2:].decode('ascii')
+                        name_map[pure_code] = match.group(2).decode('gbk')
         except Exception as e:
             print(f"获取最新名称失败: {e}")
         return name_map
 
     def get_realtime_filter(self):
-        """东方财富API获取今日行情，预筛选阳线股票（所有策略都要求最后一天收阳）"""
+        """东方财富API获取今日行情，预筛选阳线股票（所有策略都要求最后一天收阳）
+
+        返回 {代码: 最新名称}（仅含阳线股票），名称可直接用于结果；返回None表示不预筛选
+        """
         print("正在获取今日实时行情进行预筛选...")
         url = ("https://82.push2.eastmoney.com/api/qt/clist/get?"
                "pn=1&pz=50000&po=1&np=1&"
@@ -209,9 +598,10 @@ class CombinedScreenerCloud:
 
             if data.get('data') and data['data'].get('diff'):
                 total_stocks = len(data['data']['diff'])
-                positive_codes = set()
+                positive_codes = {}
                 for item in data['data']['diff']:
                     code = str(item.get('f12', ''))
+                    name = item.get('f14')
                     close = item.get('f2')
                     open_price = item.get('f17')
                     volume = item.get('f5')
@@ -231,7 +621,7 @@ class CombinedScreenerCloud:
 
                     # 阳线 + 有成交量
                     if close > open_price and volume > 0:
-                        positive_codes.add(code)
+                        positive_codes[code] = name if isinstance(name, str) else ''
 
                 print(f"东方财富返回 {total_stocks} 只股票，其中阳线: {len(positive_codes)} 只")
 
@@ -250,25 +640,27 @@ class CombinedScreenerCloud:
 
     # ==================== 策略1: 三日反转 ====================
 
-    def check_reversal_pattern(self, df):
+    def check_reversal_pattern(self, arrs):
         """三日反转形态检测: 小阴线 + 大阴线 + 低开高收阳线"""
         cfg = self.reversal_config
         min_required = 3 + cfg['prior_decline_days']
-        if df is None or len(df) < min_required:
+        if arrs is None or len(arrs) < min_required:
             return False, None
 
-        day1 = df.iloc[-3]
-        day2 = df.iloc[-2]
-        day3 = df.iloc[-1]
+        opens, highs, lows, closes = arrs.open, arrs.high, arrs.low, arrs.close
+        d1_open, d2_open, d3_open = opens[-3:]
+        d1_high, d2_high, d3_high = highs[-3:]
+        d1_low, d2_low, d3_low = lows[-3:]
+        d1_close, d2_close, d3_close = closes[-3:]
 
         # 检查形态前的累计跌幅
         prior_days = cfg['prior_decline_days']
         prior_start_idx = -3 - prior_days
-        if abs(prior_start_idx) > len(df):
+        if abs(prior_start_idx) > len(arrs):
             return False, None
 
-        prior_start_close = df.iloc[prior_start_idx]['close']
-        prior_end_close = df.iloc[-4]['close']
+        prior_start_close = closes[prior_start_idx]
+        prior_end_close = closes[-4]
 
         if prior_start_close == 0:
             return False, None
@@ -279,43 +671,37 @@ class CombinedScreenerCloud:
             if prior_decline >= 0 or abs(prior_decline) < cfg['prior_decline_min']:
                 return False, None
 
-        if day1['open'] == 0 or day2['open'] == 0 or day3['open'] == 0:
+        if d1_open == 0 or d2_open == 0 or d3_open == 0:
             return False, None
-        if day2['close'] == 0:
+        if d2_close == 0:
             return False, None
 
         # 第一天：小阴线
-        day1_change = (day1['close'] - day1['open']) / day1['open'] * 100
-        is_day1_bear = day1['close'] < day1['open']
+        day1_change = (d1_close - d1_open) / d1_open * 100
+        is_day1_bear = d1_close < d1_open
         is_day1_small = cfg['small_bear_min'] <= abs(day1_change) <= cfg['small_bear_max']
 
         # 第二天：大阴线
-        day2_change = (day2['close'] - day2['open']) / day2['open'] * 100
-        is_day2_bear = day2['close'] < day2['open']
+        day2_change = (d2_close - d2_open) / d2_open * 100
+        is_day2_bear = d2_close < d2_open
         is_day2_big = abs(day2_change) >= cfg['big_bear_min']
 
         # 第三天：低开高收阳线
-        gap_down = (day3['open'] - day2['close']) / day2['close'] * 100
-        day3_change = (day3['close'] - day3['open']) / day3['open'] * 100
+        gap_down = (d3_open - d2_close) / d2_close * 100
+        day3_change = (d3_close - d3_open) / d3_open * 100
         is_day3_gap_down = gap_down <= -cfg['gap_down_min']
-        is_day3_bull = day3['close'] > day3['open']
+        is_day3_bull = d3_close > d3_open
         is_day3_strong = day3_change >= cfg['bull_close_min']
 
-        day1_not_engulfed = not (day2['high'] >= day1['high'] and day2['low'] <= day1['low'])
-        day2_gap_down = (day2['open'] - day1['close']) / day1['close'] * 100
-
-        def upper_shadow_ratio(row):
-            body_top = max(row['open'], row['close'])
-            total_range = row['high'] - row['low']
-            if total_range == 0:
-                return 0
-            upper_shadow = row['high'] - body_top
-            return upper_shadow / total_range * 100
-
-        day1_upper_shadow = upper_shadow_ratio(day1)
-        day2_upper_shadow = upper_shadow_ratio(day2)
-        day3_upper_shadow = upper_shadow_ratio(day3)
-        max_upper_shadow = max(day1_upper_shadow, day2_upper_shadow, day3_upper_shadow)
+        day1_not_engulfed = not (d2_high >= d1_high and d2_low <= d1_low)
+        day2_gap_down = (d2_open - d1_close) / d1_close * 100
+
+        # 三天上影线占比（振幅为0记为0）
+        total_range = highs[-3:] - lows[-3:]
+        upper_shadow = highs[-3:] - np.maximum(opens[-3:], closes[-3:])
+        safe_range = np.where(total_range == 0, 1.0, total_range)
+        shadow_ratio = np.where(total_range == 0, 0.0, upper_shadow / safe_range * 100)
+        max_upper_shadow = float(shadow_ratio.max())
         upper_shadow_ok = max_upper_shadow <= cfg['max_upper_shadow']
 
         if abs(day1_change) > 0:
@@ -361,9 +747,9 @@ class CombinedScreenerCloud:
                 'shadow': round(max_upper_shadow, 1),
                 'engulfed': not day1_not_engulfed,
                 'prior_decline': round(prior_decline, 2),
-                'day1_date': str(day1['date']),
-                'day2_date': str(day2['date']),
-                'day3_date': str(day3['date']),
+                'day1_date': str(arrs.date[-3]),
+                'day2_date': str(arrs.date[-2]),
+                'day3_date': str(arrs.date[-1]),
                 'score': round(score)
             }
             return True, detail
@@ -372,40 +758,31 @@ class CombinedScreenerCloud:
 
     # ==================== 策略2: 放量突破 ====================
 
-    def _vb_is_limit_up(self, row, prev_close, code):
-        """放量突破-判断是否为涨停板大阳线"""
+    def _vb_limit_up_mask(self, arrs, threshold):
+        """放量突破-逐日标记涨停板大阳线，mask[i] 表示第 i 日（threshold为该股涨停涨幅阈值）"""
         cfg = self.volume_breakout_config
-        if prev_close == 0:
-            return False
+        opens, closes = arrs.open, arrs.close
 
-        change_pct = (row['close'] - prev_close) / prev_close * 100
-
-        if code.startswith('3'):
-            threshold = cfg['limit_up_chinext']
-        else:
-            threshold = cfg['limit_up_main_board']
-
-        if change_pct < threshold:
-            return False
+        # 涨幅达标（第0日无前收盘；前收盘为0时pct_change为NaN，同样判定为非涨停）
+        mask = np.zeros(len(closes), dtype=bool)
+        mask[1:] = arrs.pct_change >= threshold
 
         # 实体占比: 排除一字板
-        total_range = row['high'] - row['low']
-        if total_range == 0:
-            return False
-        body = abs(row['close'] - row['open'])
-        body_ratio = body / total_range
-
-        if body_ratio < cfg['limit_up_body_ratio_min']:
-            return False
+        total_range = arrs.high - arrs.low
+        has_range = total_range != 0
+        body_ratio = np.abs(closes - opens) / np.where(has_range, total_range, 1.0)
+        mask &= has_range & (body_ratio >= cfg['limit_up_body_ratio_min'])
 
         # 必须是阳线
-        if row['close'] <= row['open']:
-            return False
+        mask &= closes > opens
+        return mask
 
-        return True
+    def _vb_find_consolidation(self, closes, limit_up_idx):
+        """放量突破-涨停板前寻找止跌横盘区间
 
-    def _vb_find_consolidation(self, df, limit_up_idx):
-        """放量突破-涨停板前寻找止跌横盘区间"""
+        从涨停板前一日向前倒序累积 max/min/sum，一次得到所有候选长度的
+        振幅与均价，避免逐长度重复切片求值。
+        """
         cfg = self.volume_breakout_config
         consol_min_days = cfg['consol_min_days']
         consol_max_range = cfg['consol_max_range_pct']
@@ -414,29 +791,40 @@ class CombinedScreenerCloud:
         if consol_end < consol_min_days:
             return None
 
-        best = None
-        for length in range(consol_min_days, min(consol_end + 1, 80)):
-            consol_start = consol_end - length + 1
-            if consol_start < 0:
-                break
-
-            window = df.iloc[consol_start:consol_end + 1]
-            closes = window['close']
-            mean_price = closes.mean()
-            if mean_price == 0:
-                continue
-
-            range_pct = (closes.max() - closes.min()) / mean_price * 100
-
-            if range_pct <= consol_max_range:
-                best = (consol_start, consol_end, mean_price, range_pct, length)
-            else:
-                if best is not None:
-                    break
-
-        return best
+        max_length = min(consol_end + 1, 80) - 1
+        if max_length < consol_min_days:
+            return None
 
-    def _vb_check_prior_decline(self, df, consol_start, consol_mean):
+        # seg[k] 为 consol_end 往前第k天的收盘价，前缀即长度为k+1的窗口
+        seg = closes[consol_end - max_length + 1:consol_end + 1][::-1]
+        run_max = np.maximum.accumulate(seg)[consol_min_days - 1:]
+        run_min = np.minimum.accumulate(seg)[consol_min_days - 1:]
+        lengths = np.arange(consol_min_days, max_length + 1)
+        means = np.cumsum(seg)[consol_min_days - 1:] / lengths
+
+        valid = means != 0
+        safe_means = np.where(valid, means, 1.0)
+        range_pcts = (run_max - run_min) / safe_means * 100
+        in_range = valid & (range_pcts <= consol_max_range)
+
+        # 取首段连续满足条件的最长窗口（遇到首个超限长度即停止）
+        ok_idx = np.flatnonzero(in_range)
+        if ok_idx.size == 0:
+            return None
+        first_ok = ok_idx[0]
+        over = np.flatnonzero(valid[first_ok:] & ~in_range[first_ok:])
+        if over.size:
+            ok_idx = ok_idx[ok_idx < first_ok + over[0]]
+        i = ok_idx[-1]
+
+        length = int(lengths[i])
+        consol_start = consol_end - length + 1
+        # 选定窗口再按成对求和精确计算均价，避免累积和的舍入误差影响输出
+        mean_price = closes[consol_start:consol_end + 1].mean()
+        range_pct = (run_max[i] - run_min[i]) / mean_price * 100
+        return (consol_start, consol_end, mean_price, range_pct, length)
+
+    def _vb_check_prior_decline(self, closes, consol_start, consol_mean):
         """放量突破-检查横盘前的前期下跌"""
         cfg = self.volume_breakout_config
         lookback = cfg['prior_lookback_days']
@@ -446,11 +834,11 @@ class CombinedScreenerCloud:
         if search_start >= consol_start:
             return None
 
-        prior_slice = df.iloc[search_start:consol_start]
+        prior_slice = closes[search_start:consol_start]
         if len(prior_slice) == 0:
             return None
 
-        prior_high = prior_slice['close'].max()
+        prior_high = prior_slice.max()
 
         if consol_mean == 0:
             return None
@@ -463,77 +851,81 @@ class CombinedScreenerCloud:
         return (decline_pct, prior_high)
 
     def _vb_calculate_score(self, detail):
-        """放量突破-7维评分（满分100分）"""
+        """放量突破-7维评分（满分100分）
+
+        各维度为线性映射: (value-low)/(high-low) 截断到[0,1]后乘以该维满分
+        """
         score = 0
 
         # 1. 前期跌幅深度 (15分)
-        score += self._linear_map(detail['prior_decline_pct'], 15, 40, 0, 15)
+        score += max(0, min(1, (detail['prior_decline_pct'] - 15) / (40 - 15))) * 15
 
         # 2. 横盘时间长度 (10分)
-        score += self._linear_map(detail['consol_days'], 22, 60, 0, 10)
+        score += max(0, min(1, (detail['consol_days'] - 22) / (60 - 22))) * 10
 
         # 3. 涨停K线质量 (20分)
-        score += self._linear_map(detail['limit_up_body_ratio'], 0.6, 1.0, 0, 10)
-        score += self._linear_map(detail['limit_up_vol_ratio'], 1, 4, 0, 10)
+        score += max(0, min(1, (detail['limit_up_body_ratio'] - 0.6) / (1.0 - 0.6))) * 10
+        score += max(0, min(1, (detail['limit_up_vol_ratio'] - 1) / (4 - 1))) * 10
 
         # 4. 回踩横盘紧凑度 (15分)
         if detail['post_range_pct'] <= 5:
             score += 15
         elif detail['post_range_pct'] <= 10:
-            score += self._linear_map(detail['post_range_pct'], 10, 5, 0, 15)
+            score += max(0, min(1, (detail['post_range_pct'] - 10) / (5 - 10))) * 15
 
         # 5. 回踩持续天数 (10分)
-        score += self._linear_map(detail['post_consol_days'], 5, 15, 0, 10)
+        score += max(0, min(1, (detail['post_consol_days'] - 5) / (15 - 5))) * 10
 
         # 6. 突破放量倍数 (15分)
-        score += self._linear_map(detail['break_vol_ratio'], 1, 3, 0, 15)
+        score += max(0, min(1, (detail['break_vol_ratio'] - 1) / (3 - 1))) * 15
 
         # 7. 突破阳线实体 (15分)
-        score += self._linear_map(detail['break_body_ratio'], 0.3, 0.9, 0, 15)
+        score += max(0, min(1, (detail['break_body_ratio'] - 0.3) / (0.9 - 0.3))) * 15
 
         return round(min(100, max(0, score)))
 
-    @staticmethod
-    def _linear_map(value, low, high, score_low, score_high):
-        """线性映射: value在[low, high]区间映射到[score_low, score_high]"""
-        if high == low:
-            return score_high if value >= high else score_low
-        ratio = (value - low) / (high - low)
-        ratio = max(0, min(1, ratio))
-        return score_low + ratio * (score_high - score_low)
-
-    def check_volume_breakout_pattern(self, df, code):
+    def check_volume_breakout_pattern(self, arrs, code):
         """放量突破形态检测: 前期下跌 → 止跌横盘 → 涨停板 → 回踩横盘 → 放量突破"""
         cfg = self.volume_breakout_config
-        if df is None or len(df) < 50:
+        if arrs is None or len(arrs) < 50:
             return False, None
 
-        n = len(df)
-        last = df.iloc[-1]
-        prev = df.iloc[-2]
+        n = len(arrs)
+        opens, highs, lows, closes = arrs.open, arrs.high, arrs.low, arrs.close
+        volumes = arrs.volume
+        last_open, last_high, last_low, last_close = opens[-1], highs[-1], lows[-1], closes[-1]
+        last_volume, prev_volume = volumes[-1], volumes[-2]
+        pct_change = arrs.pct_change
 
         # 最后一天必须是阳线
-        if last['close'] <= last['open']:
+        if last_close <= last_open:
             return False, None
         # 必须放量（成交量 > 前一日）
-        if prev['volume'] == 0 or last['volume'] <= prev['volume']:
+        if prev_volume == 0 or last_volume <= prev_volume:
             return False, None
 
+        # 涨停阈值按板块每只股票只判定一次
+        if code.startswith('3'):
+            limit_up_threshold = cfg['limit_up_chinext']
+        else:
+            limit_up_threshold = cfg['limit_up_main_board']
+
         # 向前扫描涨停板，并验证回踩横盘
         max_lookback = min(cfg['post_consol_max_lookback'], n - 30)
         found_pattern = False
         best_detail = None
 
-        for scan_idx in range(2, max_lookback + 1):
-            candidate_idx = n - 1 - scan_idx
-            if candidate_idx < 1:
-                break
-
-            candidate = df.iloc[candidate_idx]
-            prev_of_candidate = df.iloc[candidate_idx - 1]
+        # 候选涨停日: 距突破日2~max_lookback天，一次性向量化判定后由近及远遍历
+        scan_start = max(1, n - 1 - max_lookback)
+        limit_up_mask = self._vb_limit_up_mask(arrs, limit_up_threshold)
+        candidates = np.flatnonzero(limit_up_mask[scan_start:n - 2]) + scan_start
 
-            if not self._vb_is_limit_up(candidate, prev_of_candidate['close'], code):
-                continue
+        for candidate_idx in candidates[::-1].tolist():
+            cand_open = opens[candidate_idx]
+            cand_high = highs[candidate_idx]
+            cand_low = lows[candidate_idx]
+            cand_close = closes[candidate_idx]
+            limit_up_change = pct_change[candidate_idx - 1]
 
             # 回踩区间: 涨停板次日 到 突破日前一日
             post_start = candidate_idx + 1
@@ -543,53 +935,49 @@ class CombinedScreenerCloud:
             if post_days < cfg['post_consol_min_days']:
                 continue
 
-            post_slice = df.iloc[post_start:post_end + 1]
-            limit_up_open = candidate['open']
-            limit_up_close = candidate['close']
+            post_closes = closes[post_start:post_end + 1]
 
             # 每天收盘价 >= 涨停板开盘价
-            if (post_slice['close'] < limit_up_open).any():
+            if (post_closes < cand_open).any():
                 continue
 
             # 突破日收盘价 > 涨停板收盘价
-            if last['close'] <= limit_up_close:
+            if last_close <= cand_close:
                 continue
 
             # 涨停板前的止跌横盘
-            consol_result = self._vb_find_consolidation(df, candidate_idx)
+            consol_result = self._vb_find_consolidation(closes, candidate_idx)
             if consol_result is None:
                 continue
 
             consol_start, consol_end, consol_mean, consol_range_pct, consol_days = consol_result
 
             # 横盘前的前期下跌
-            decline_result = self._vb_check_prior_decline(df, consol_start, consol_mean)
+            decline_result = self._vb_check_prior_decline(closes, consol_start, consol_mean)
             if decline_result is None:
                 continue
 
             prior_decline_pct, prior_high = decline_result
 
             # 形态匹配成功，计算详细信息
-            limit_up_change = (candidate['close'] - prev_of_candidate['close']) / prev_of_candidate['close'] * 100
-            body = abs(candidate['close'] - candidate['open'])
-            total_range = candidate['high'] - candidate['low']
+            body = abs(cand_close - cand_open)
+            total_range = cand_high - cand_low
             limit_up_body_ratio = body / total_range if total_range > 0 else 0
 
-            post_closes = post_slice['close']
             post_mean = post_closes.mean()
             post_range_pct = (post_closes.max() - post_closes.min()) / post_mean * 100 if post_mean > 0 else 999
 
             # 涨停日量比
             vol_start = max(0, candidate_idx - 5)
-            prior_avg_vol = df.iloc[vol_start:candidate_idx]['volume'].mean()
-            limit_up_vol_ratio = candidate['volume'] / prior_avg_vol if prior_avg_vol > 0 else 1
+            prior_avg_vol = volumes[vol_start:candidate_idx].mean()
+            limit_up_vol_ratio = volumes[candidate_idx] / prior_avg_vol if prior_avg_vol > 0 else 1
 
             # 突破日量比
-            break_vol_ratio = last['volume'] / prev['volume'] if prev['volume'] > 0 else 1
+            break_vol_ratio = last_volume / prev_volume if prev_volume > 0 else 1
 
             # 突破阳线实体占比
-            break_total_range = last['high'] - last['low']
-            break_body = last['close'] - last['open']
+            break_total_range = last_high - last_low
+            break_body = last_close - last_open
             break_body_ratio = break_body / break_total_range if break_total_range > 0 else 0
 
             detail = {
@@ -597,17 +985,17 @@ class CombinedScreenerCloud:
                 'consol_days': consol_days,
                 'consol_range_pct': round(consol_range_pct, 2),
                 'consol_mean_price': round(consol_mean, 2),
-                'limit_up_date': str(candidate['date']),
+                'limit_up_date': str(arrs.date[candidate_idx]),
                 'limit_up_change': round(limit_up_change, 2),
                 'limit_up_body_ratio': round(limit_up_body_ratio, 2),
                 'limit_up_vol_ratio': round(limit_up_vol_ratio, 2),
                 'post_consol_days': post_days,
                 'post_range_pct': round(post_range_pct, 2),
-                'break_date': str(last['date']),
-                'break_change': round((last['close'] - prev['close']) / prev['close'] * 100, 2),
+                'break_date': str(arrs.date[-1]),
+                'break_change': round(pct_change[-1], 2),
                 'break_vol_ratio': round(break_vol_ratio, 2),
                 'break_body_ratio': round(break_body_ratio, 2),
-                'break_close': round(last['close'], 2),
+                'break_close': round(last_close, 2),
             }
 
             detail['score'] = self._vb_calculate_score(detail)
@@ -623,29 +1011,22 @@ class CombinedScreenerCloud:
 
     # ==================== 策略3: 缩量突破 ====================
 
-    def _sb_is_limit_up(self, close, prev_close, code):
-        """缩量突破-判断是否涨停"""
-        cfg = self.shrink_breakout_config
-        if prev_close == 0:
-            return False
-        change_pct = (close - prev_close) / prev_close * 100
-        if code.startswith('300'):
-            return change_pct >= cfg['limit_up_chinext_pct']
-        else:
-            return change_pct >= cfg['limit_up_main_pct']
+    def _sb_limit_up_mask(self, pct_change, threshold):
+        """缩量突破-逐日涨停标记，mask[j] 表示第 j+1 日相对第 j 日涨停（NaN视为非涨停）"""
+        return pct_change >= threshold
 
-    def _sb_find_limit_up_day(self, df, code):
+    def _sb_find_limit_up_day(self, limit_up_mask):
         """缩量突破-从今日向前搜索最近的涨停日，且距今至少6个交易日"""
-        n = len(df)
-        for i in range(n - 7, 0, -1):
-            if self._sb_is_limit_up(df.iloc[i]['close'], df.iloc[i - 1]['close'], code):
-                return i
-        return None
+        n = len(limit_up_mask) + 1
+        candidates = np.flatnonzero(limit_up_mask[:n - 7])
+        if candidates.size == 0:
+            return None
+        return int(candidates[-1]) + 1
 
-    def _sb_check_post_consolidation(self, df, limit_up_idx):
+    def _sb_check_post_consolidation(self, closes, limit_up_idx):
         """缩量突破-检查涨停后横盘"""
         cfg = self.shrink_breakout_config
-        n = len(df)
+        n = len(closes)
         signal_idx = n - 1
         start = limit_up_idx + 1
         end = signal_idx
@@ -653,18 +1034,18 @@ class CombinedScreenerCloud:
         if end - start < cfg['consolidation2_min_days']:
             return False, None
 
-        post_df = df.iloc[start:end]
-        limit_up_close = df.iloc[limit_up_idx]['close']
+        post_closes = closes[start:end]
+        limit_up_close = closes[limit_up_idx]
 
         # 所有K线收盘价严格>=涨停日收盘价
         tolerance = limit_up_close * cfg['consolidation2_support_tolerance'] / 100
-        if (post_df['close'] < limit_up_close - tolerance).any():
+        if (post_closes < limit_up_close - tolerance).any():
             return False, None
 
         # 振幅控制
-        max_close = post_df['close'].max()
-        min_close = post_df['close'].min()
-        avg_close = post_df['close'].mean()
+        max_close = post_closes.max()
+        min_close = post_closes.min()
+        avg_close = post_closes.mean()
         if avg_close == 0:
             return False, None
         amplitude = (max_close - min_close) / avg_close * 100
@@ -672,7 +1053,7 @@ class CombinedScreenerCloud:
             return False, None
 
         # 今日收盘价必须突破横盘区间所有收盘价
-        signal_close = df.iloc[signal_idx]['close']
+        signal_close = closes[signal_idx]
         if signal_close <= max_close:
             return False, None
 
@@ -684,7 +1065,7 @@ class CombinedScreenerCloud:
         }
         return True, detail
 
-    def _sb_check_pre_consolidation(self, df, limit_up_idx, code):
+    def _sb_check_pre_consolidation(self, closes, limit_up_idx, limit_up_mask):
         """缩量突破-检查涨停前横盘"""
         cfg = self.shrink_breakout_config
         min_days = cfg['consolidation1_min_days']
@@ -693,45 +1074,42 @@ class CombinedScreenerCloud:
         if limit_up_idx < min_days:
             return False, None
 
-        best_start = None
         best_end = limit_up_idx
 
-        for start in range(limit_up_idx - min_days, -1, -1):
-            segment = df.iloc[start:best_end]
-            seg_max = segment['close'].max()
-            seg_min = segment['close'].min()
-            seg_avg = segment['close'].mean()
-            if seg_avg == 0:
-                break
-            amp = (seg_max - seg_min) / seg_avg * 100
-            if amp <= max_amp:
-                best_start = start
-            else:
-                break
-
-        if best_start is None:
+        # 从涨停日前一日倒序累积 max/min/sum，prefix[k] 即区间 [best_end-k-1, best_end)
+        seg = closes[:best_end][::-1]
+        run_max = np.maximum.accumulate(seg)[min_days - 1:]
+        run_min = np.minimum.accumulate(seg)[min_days - 1:]
+        seg_avg = np.cumsum(seg)[min_days - 1:] / np.arange(min_days, best_end + 1)
+
+        # 区间向前扩展，遇到首个振幅超限（或均价为0）即停止
+        safe_avg = np.where(seg_avg == 0, 1.0, seg_avg)
+        failed = (seg_avg == 0) | ((run_max - run_min) / safe_avg * 100 > max_amp)
+        stop = int(np.argmax(failed)) if failed.any() else len(failed)
+        if stop == 0:
             return False, None
 
+        best_start = best_end - (stop - 1 + min_days)
+
         consolidation_days = best_end - best_start
         if consolidation_days < min_days:
             return False, None
 
-        # 检查横盘区间内是否有其他涨停板
-        for i in range(best_start + 1, best_end):
-            if self._sb_is_limit_up(df.iloc[i]['close'], df.iloc[i - 1]['close'], code):
-                return False, None
+        # 检查横盘区间内是否有其他涨停板（第 best_start+1 ~ best_end-1 日）
+        if limit_up_mask[best_start:best_end - 1].any():
+            return False, None
 
         detail = {
             'consolidation1_start': best_start,
             'consolidation1_days': consolidation_days,
             'consolidation1_amplitude': round(
-                (df.iloc[best_start:best_end]['close'].max() - df.iloc[best_start:best_end]['close'].min())
-                / df.iloc[best_start:best_end]['close'].mean() * 100, 2
+                (run_max[stop - 1] - run_min[stop - 1])
+                / closes[best_start:best_end].mean() * 100, 2
             ),
         }
         return True, detail
 
-    def _sb_check_prior_decline(self, df, consolidation_start):
+    def _sb_check_prior_decline(self, closes, consolidation_start):
         """缩量突破-检查横盘前是否有显著下跌"""
         cfg = self.shrink_breakout_config
         lookback = min(consolidation_start, 60)
@@ -739,10 +1117,8 @@ class CombinedScreenerCloud:
             return False, None
 
         search_start = consolidation_start - lookback
-        search_df = df.iloc[search_start:consolidation_start]
-
-        max_close = search_df['close'].max()
-        end_close = df.iloc[consolidation_start]['close']
+        max_close = closes[search_start:consolidation_start].max()
+        end_close = closes[consolidation_start]
 
         if max_close == 0:
             return False, None
@@ -757,15 +1133,15 @@ class CombinedScreenerCloud:
         }
         return True, detail
 
-    def _sb_check_signal(self, df):
+    def _sb_check_signal(self, opens, closes, volumes, dates):
         """缩量突破-检查今日信号条件：阳线 + 量能死叉"""
         cfg = self.shrink_breakout_config
-        n = len(df)
-        signal_idx = n - 1
-        row = df.iloc[signal_idx]
+        n = len(closes)
+        signal_open = opens[-1]
+        signal_close = closes[-1]
 
         # 今日是阳线
-        if row['close'] <= row['open']:
+        if signal_close <= signal_open:
             return False, None
 
         # 计算均量线
@@ -775,8 +1151,8 @@ class CombinedScreenerCloud:
         if n < ma_long_period:
             return False, None
 
-        vol_ma_short = df['volume'].iloc[n - ma_short_period:n].mean()
-        vol_ma_long = df['volume'].iloc[n - ma_long_period:n].mean()
+        vol_ma_short = volumes[n - ma_short_period:].mean()
+        vol_ma_long = volumes[n - ma_long_period:].mean()
 
         if vol_ma_long == 0:
             return False, None
@@ -785,7 +1161,7 @@ class CombinedScreenerCloud:
         if vol_ma_short >= vol_ma_long:
             return False, None
 
-        signal_change = (row['close'] - row['open']) / row['open'] * 100
+        signal_change = (signal_close - signal_open) / signal_open * 100
         vol_ratio = vol_ma_short / vol_ma_long
 
         detail = {
@@ -793,7 +1169,7 @@ class CombinedScreenerCloud:
             'vol_ma_short': round(vol_ma_short, 0),
             'vol_ma_long': round(vol_ma_long, 0),
             'vol_ratio': round(vol_ratio, 4),
-            'signal_date': str(row['date']),
+            'signal_date': str(dates[-1]),
         }
         return True, detail
 
@@ -851,45 +1227,55 @@ class CombinedScreenerCloud:
 
         return min(100, max(0, round(score)))
 
-    def check_shrink_breakout_pattern(self, df, code):
+    def check_shrink_breakout_pattern(self, arrs, code):
         """缩量突破形态检测: 下跌 → 横盘 → 涨停 → 横盘 → 缩量突破"""
-        if df is None or len(df) < 60:
+        if arrs is None or len(arrs) < 60:
             return False, None
 
+        opens, closes, dates = arrs.open, arrs.close, arrs.date
+
         # Phase 1: 检查今日信号条件
-        signal_ok, signal_detail = self._sb_check_signal(df)
+        signal_ok, signal_detail = self._sb_check_signal(opens, closes, arrs.volume, dates)
         if not signal_ok:
             return False, None
 
         # Phase 2: 寻找最近的涨停板
-        limit_up_idx = self._sb_find_limit_up_day(df, code)
+        cfg = self.shrink_breakout_config
+        if code.startswith('300'):
+            limit_up_threshold = cfg['limit_up_chinext_pct']
+        else:
+            limit_up_threshold = cfg['limit_up_main_pct']
+        limit_up_mask = self._sb_limit_up_mask(arrs.pct_change, limit_up_threshold)
+        limit_up_idx = self._sb_find_limit_up_day(limit_up_mask)
         if limit_up_idx is None:
             return False, None
 
         # Phase 3: 检查涨停后横盘
-        post_ok, post_detail = self._sb_check_post_consolidation(df, limit_up_idx)
+        post_ok, post_detail = self._sb_check_post_consolidation(closes, limit_up_idx)
         if not post_ok:
             return False, None
 
         # Phase 4: 检查涨停前横盘
-        pre_ok, pre_detail = self._sb_check_pre_consolidation(df, limit_up_idx, code)
+        pre_ok, pre_detail = self._sb_check_pre_consolidation(closes, limit_up_idx, limit_up_mask)
         if not pre_ok:
             return False, None
 
         # Phase 5: 检查横盘前下跌
-        decline_ok, decline_detail = self._sb_check_prior_decline(df, pre_detail['consolidation1_start'])
+        decline_ok, decline_detail = self._sb_check_prior_decline(closes, pre_detail['consolidation1_start'])
         if not decline_ok:
             return False, None
 
         # 涨停日信息
-        limit_up_row = df.iloc[limit_up_idx]
-        prev_close = df.iloc[limit_up_idx - 1]['close']
-        limit_up_change = (limit_up_row['close'] - prev_close) / prev_close * 100
+        lu_open = opens[limit_up_idx]
+        lu_high = arrs.high[limit_up_idx]
+        lu_low = arrs.low[limit_up_idx]
+        lu_close = closes[limit_up_idx]
+        limit_up_change = arrs.pct_change[limit_up_idx - 1]
 
         # 涨停形态判断
-        if limit_up_row['open'] == limit_up_row['close'] == limit_up_row['high']:
+        if lu_open == lu_close == lu_high:
             limit_up_type = '一字板'
-        elif limit_up_row['open'] == limit_up_row['low'] and limit_up_row['close'] == limit_up_row['high']:
+        elif lu_open == lu_low and lu_close == lu_high:
             limit_up_type = 'T字板'
         else:
             limit_up_type = '普通涨停'
@@ -900,7 +1286,7 @@ class CombinedScreenerCloud:
             **post_detail,
             **pre_detail,
             **decline_detail,
-            'limit_up_date': str(limit_up_row['date']),
+            'limit_up_date': str(dates[limit_up_idx]),
             'limit_up_change': round(limit_up_change, 2),
             'limit_up_type': limit_up_type,
         }
@@ -911,39 +1297,52 @@ class CombinedScreenerCloud:
 
     # ==================== 筛选层 ====================
 
-    def screen_single_stock(self, bs_code, code, name):
-        """一次获取K线，串行调用3个check_pattern"""
-        df = self.get_stock_history(bs_code)
-        if df is None:
-            return None
+    def screen_single_stock_flags(self, bs_code, code, name):
+        """一次获取K线，串行调用3个check_pattern
 
-        results = {}
+        返回 (flags, reversal, volume_breakout, shrink_breakout)：flags 为 HIT_* 标志位之和，
+        未命中的策略对应项为 None（多数股票不命中，不构造任何结果dict）
+        """
+        rv = vb = sb = None
+        flags = 0
+        arrs = self.get_stock_history(bs_code)
+        if arrs is None:
+            return flags, rv, vb, sb
 
-        # 策略1: 三日反转（check_pattern只需df）
-        try:
-            match, detail = self.check_reversal_pattern(df)
-            if match:
-                results['reversal'] = {'code': code, 'name': name, **detail}
-        except Exception:
-            pass
+        # 三个策略都要求最后一根K线收阳，放量突破还要求放量：不满足时直接跳过
+        if arrs.close[-1] <= arrs.open[-1]:
+            return flags, rv, vb, sb
+        volume_up = arrs.volume[-2] != 0 and arrs.volume[-1] > arrs.volume[-2]
 
-        # 策略2: 放量突破（check_pattern需要df和code）
+        # 策略1: 三日反转（check_pattern只需K线数组）
         try:
-            match, detail = self.check_volume_breakout_pattern(df, code)
+            match, detail = self.check_reversal_pattern(arrs)
             if match:
-                results['volume_breakout'] = {'code': code, 'name': name, **detail}
+                rv = {'code': code, 'name': name, **detail}
+                flags |= HIT_REVERSAL
         except Exception:
             pass
 
-        # 策略3: 缩量突破（check_pattern需要df和code）
+        # 策略2: 放量突破（check_pattern需要K线数组和code）
+        if volume_up:
+            try:
+                match, detail = self.check_volume_breakout_pattern(arrs, code)
+                if match:
+                    vb = {'code': code, 'name': name, **detail}
+                    flags |= HIT_VOLUME_BREAKOUT
+            except Exception:
+                pass
+
+        # 策略3: 缩量突破（check_pattern需要K线数组和code）
         try:
-            match, detail = self.check_shrink_breakout_pattern(df, code)
+            match, detail = self.check_shrink_breakout_pattern(arrs, code)
             if match:
-                results['shrink_breakout'] = {'code': code, 'name': name, **detail}
+                sb = {'code': code, 'name': name, **detail}
+                flags |= HIT_SHRINK_BREAKOUT
         except Exception:
             pass
 
-        return results if results else None
+        return flags, rv, vb, sb
 
     # ==================== 主流程 ====================
 
@@ -952,7 +1351,8 @@ class CombinedScreenerCloud:
         print("=" * 70)
         print("A股三合一多策略选股器 (GitHub Actions 云端版)")
         print("策略: 三日反转 | 放量突破 | 缩量突破")
-        print("数据源: BaoStock (串行遍历) + 东方财富 (预筛选)")
+        kline_source = "东方财富/BaoStock" if self.eastmoney_kline else "BaoStock"
+        print(f"数据源: BaoStock (股票列表) + {kline_source} (日K线，多进程并发) + 东方财富 (预筛选) + 新浪财经 (最新名称)")
         print("=" * 70)
 
         start_time = time.time()
@@ -961,6 +1361,7 @@ class CombinedScreenerCloud:
         if not self.login():
             return
 
+        logout_thread = None
         try:
             stocks = self.get_stock_list()
             if not stocks:
@@ -976,71 +1377,117 @@ class CombinedScreenerCloud:
             else:
                 print("预筛选失败，将遍历全部股票（耗时较长）")
 
-            print(f"\n开始筛选（串行遍历 {len(stocks)} 只股票）...")
+            print(f"\n开始筛选（{self.max_workers} 进程并发，共 {len(stocks)} 只股票）...")
             reversal_results = []
             volume_results = []
             shrink_results = []
             total = len(stocks)
+            completed = 0
             timeout_hit = False
-
-            for i, stock in enumerate(stocks):
-                # 超时保护
-                elapsed = time.time() - start_time
-                if elapsed > max_elapsed:
-                    print(f"\n⚠ 已运行 {elapsed:.0f}秒，触发超时保护，保存已有结果")
-                    timeout_hit = True
-                    break
-
-                if (i + 1) % 100 == 0:
-                    elapsed = time.time() - start_time
-                    rate = (i + 1) / elapsed if elapsed > 0 else 0
-                    eta = (total - i - 1) / rate if rate > 0 else 0
-                    print(f"进度: {i+1}/{total} ({(i+1)*100//total}%) | "
-                          f"耗时: {elapsed:.0f}s | 预计剩余: {eta:.0f}s")
-                try:
-                    result = self.screen_single_stock(stock['bs_code'], stock['code'], stock['name'])
-                    if result:
+            collected = {}  # {股票列表下标: 命中结果}
+            hit_log = []  # 命中日志缓冲，攒批写出
+            log_append = hit_log.append
+            write = sys.stdout.write
+            # 终端下每100只刷新进度；CI日志（非tty）中每1000只一次，避免刷屏
+            progress_every = 100 if sys.stdout.isatty() else 1000
+
+            # BaoStock会话不可跨进程共享，每个子进程在initializer中各自登录
+            # 按完成顺序取回结果，慢股票不会阻塞已完成结果的汇总与进度
+            # （chunksize须为1：更大时返回普通生成器，不支持 next(timeout)）
+            with mp.Pool(processes=self.max_workers, initializer=_init_worker) as pool:
+                results_iter = pool.imap_unordered(screen_single_stock_worker, enumerate(stocks))
+
+                while completed < total:
+                    # 超时保护（退出with时终止子进程，已取回的结果保留）
+                    remaining = max_elapsed - (time.time() - start_time)
+                    try:
+                        idx, flags, rv, vb, sb = results_iter.next(timeout=max(remaining, 0))
+                    except mp.TimeoutError:
+                        timeout_hit = True
+                        break
+
+                    completed += 1
+                    if completed % progress_every == 0:
+                        elapsed = time.time() - start_time
+                        rate = completed / elapsed if elapsed > 0 else 0
+                        eta = (total - completed) / rate if rate > 0 else 0
+                        log_append(f"进度: {completed}/{total} ({completed*100//total}%) | "
+                                   f"耗时: {elapsed:.0f}s | 预计剩余: {eta:.0f}s\n")
+                        write(''.join(hit_log))
+                        hit_log.clear()
+
+                    if flags:
+                        collected[idx] = (rv, vb, sb)
                         hits = []
-                        if 'reversal' in result:
-                            reversal_results.append(result['reversal'])
+                        if flags & HIT_REVERSAL:
                             hits.append('三日反转')
-                        if 'volume_breakout' in result:
-                            volume_results.append(result['volume_breakout'])
+                        if flags & HIT_VOLUME_BREAKOUT:
                             hits.append('放量突破')
-                        if 'shrink_breakout' in result:
-                            shrink_results.append(result['shrink_breakout'])
+                        if flags & HIT_SHRINK_BREAKOUT:
                             hits.append('缩量突破')
-                        if hits:
-                            print(f"  命中: {stock['code']} {stock['name']} [{', '.join(hits)}]")
-                except Exception:
-                    pass
-
-            # 按评分排序
-            reversal_results.sort(key=lambda x: x.get('score', 0), reverse=True)
-            volume_results.sort(key=lambda x: x.get('score', 0), reverse=True)
-            shrink_results.sort(key=lambda x: x.get('score', 0), reverse=True)
-
-            # 获取最新名称
-            all_codes = set()
-            for r in reversal_results + volume_results + shrink_results:
-                all_codes.add(r['code'])
-
-            if all_codes:
+                        stock = stocks[idx]
+                        log_append(f"  命中: {stock['code']} {stock['name']} [{', '.join(hits)}]\n")
+                        if len(hit_log) >= 50:
+                            write(''.join(hit_log))
+                            hit_log.clear()
+
+                if not timeout_hit:
+                    # 正常结束时让子进程自行退出（执行各自的BaoStock登出），而不是由with直接terminate
+                    pool.close()
+                    pool.join()
+
+            if hit_log:
+                sys.stdout.write(''.join(hit_log))
+
+            # 主进程的BaoStock会话只用于获取股票列表，筛选结束即在后台登出，与名称查询、文件写出重叠
+            logout_thread = threading.Thread(target=self.logout, daemon=True)
+            logout_thread.start()
+
+            if timeout_hit:
+                print(f"\n⚠ 已运行 {time.time() - start_time:.0f}秒，触发超时保护，保存已有结果")
+
+            # 结果按完成顺序到达，这里恢复股票列表原顺序，使同分排序稳定
+            # 预先绑定各结果列表的append，省去循环内的属性查找
+            appends = (reversal_results.append, volume_results.append, shrink_results.append)
+            for idx in sorted(collected):
+                for hit, append in zip(collected[idx], appends):
+                    if hit is not None:
+                        hit.setdefault('score', 0)
+                        append(hit)
+
+            # 按评分排序（入列时已保证score存在，itemgetter为C实现，比lambda+get更快）
+            by_score = itemgetter('score')
+            reversal_results.sort(key=by_score, reverse=True)
+            volume_results.sort(key=by_score, reverse=True)
+            shrink_results.sort(key=by_score, reverse=True)
+
+            # 获取最新名称：预筛选已带回东方财富当日名称，只对缺名称的代码再查新浪
+            fresh_names = positive_codes or {}
+            all_hits = list(chain(reversal_results, volume_results, shrink_results))
+            stale = list({r['code'] for r in all_hits if not fresh_names.get(r['code'])})
+
+            name_map = {}
+            if stale:
                 print("\n正在获取最新股票名称...")
-                name_map = self.get_latest_names(list(all_codes))
-                for r in reversal_results + volume_results + shrink_results:
-                    if r['code'] in name_map:
-                        r['name'] = name_map[r['code']]
+                name_map = self.get_latest_names(stale)
+            for r in all_hits:
+                code = r['code']
+                name = name_map.get(code) or fresh_names.get(code)
+                if name:
+                    r['name'] = name
 
             elapsed = time.time() - start_time
-            scanned = i + 1 if timeout_hit else total
+            scanned = completed
 
             # 保存结果
             self._save_results(reversal_results, volume_results, shrink_results,
                                scanned, elapsed, timeout_hit)
 
         finally:
-            self.logout()
+            if logout_thread is not None:
+                logout_thread.join(timeout=5)
+            else:
+                self.logout()
 
     # ==================== 输出层 ====================
 
@@ -1049,25 +1496,26 @@ class CombinedScreenerCloud:
         """保存结果到CSV/JSON/Markdown + GitHub Actions Summary"""
         output_dir = os.environ.get('OUTPUT_DIR', '.')
         os.makedirs(output_dir, exist_ok=True)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        now = datetime.now()  # 文件名与报告共用同一时刻
+        timestamp = now.strftime('%Y%m%d_%H%M%S')
+        now_str = now.strftime('%Y-%m-%d %H:%M:%S')
+        json_path = os.path.join(output_dir, "latest_results.json")
+        md_path = os.path.join(output_dir, "results.md")
 
         # 保存 CSV 文件（每个策略各一个）
         if reversal_results:
-            df = pd.DataFrame(reversal_results)
             csv_path = os.path.join(output_dir, f"reversal_{timestamp}.csv")
-            df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+            _write_csv(reversal_results, csv_path, _REVERSAL_COLUMNS)
             print(f"\n三日反转 CSV: {csv_path}")
 
         if volume_results:
-            df = pd.DataFrame(volume_results)
             csv_path = os.path.join(output_dir, f"volume_breakout_{timestamp}.csv")
-            df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+            _write_csv(volume_results, csv_path, _VOLUME_BREAKOUT_COLUMNS)
             print(f"放量突破 CSV: {csv_path}")
 
         if shrink_results:
-            df = pd.DataFrame(shrink_results)
             csv_path = os.path.join(output_dir, f"shrink_breakout_{timestamp}.csv")
-            df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+            _write_csv(shrink_results, csv_path, _SHRINK_BREAKOUT_COLUMNS)
             print(f"缩量突破 CSV: {csv_path}")
 
         # 保存 JSON（供 Claude Agent 读取）
@@ -1089,25 +1537,24 @@ class CombinedScreenerCloud:
                 'results': shrink_results
             }
         }
-        json_path = os.path.join(output_dir, "latest_results.json")
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=2)
+        # 下游（Claude Agent）读取该文件，原子替换避免读到半截JSON
+        _write_atomic(json_path, _dumps_json(json_data))
         print(f"JSON 结果: {json_path}")
 
         # 保存 Markdown 报告
         md_content = self._format_markdown(
-            reversal_results, volume_results, shrink_results, total_scanned, elapsed, timeout_hit
+            reversal_results, volume_results, shrink_results, total_scanned, elapsed, timeout_hit,
+            now_str=now_str
         )
-        md_path = os.path.join(output_dir, "results.md")
-        with open(md_path, 'w', encoding='utf-8') as f:
-            f.write(md_content)
+        md_bytes = md_content.encode('utf-8')  # 只编码一次，报告文件和Summary共用
+        _write_atomic(md_path, md_bytes)
         print(f"Markdown 报告: {md_path}")
 
         # 写入 GitHub Actions Summary
         github_step_summary = os.environ.get('GITHUB_STEP_SUMMARY')
         if github_step_summary:
-            with open(github_step_summary, 'a', encoding='utf-8') as f:
-                f.write(md_content)
+            with open(github_step_summary, 'ab') as f:
+                f.write(md_bytes)
             print("已写入 GitHub Actions Summary")
 
         # 打印终端汇总
@@ -1120,85 +1567,103 @@ class CombinedScreenerCloud:
         print("=" * 70)
 
     def _format_markdown(self, reversal_results, volume_results, shrink_results,
-                         total_scanned, elapsed, timeout_hit=False):
-        """格式化Markdown报告"""
-        md = f"## A股三合一多策略选股结果\n\n"
-        md += f"**筛选时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        md += f"**扫描股票**: {total_scanned} 只 | **耗时**: {elapsed:.1f}秒"
+                         total_scanned, elapsed, timeout_hit=False, now_str=None):
+        """格式化Markdown报告（各段先收集到列表，最后一次join）"""
+        if now_str is None:
+            now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        parts = ["## A股三合一多策略选股结果\n\n"]
+        parts.append(f"**筛选时间**: {now_str}\n")
+        parts.append(f"**扫描股票**: {total_scanned} 只 | **耗时**: {elapsed:.1f}秒")
         if timeout_hit:
-            md += " | **注意**: 超时保护触发，结果为部分扫描"
-        md += "\n\n"
+            parts.append(" | **注意**: 超时保护触发，结果为部分扫描")
+        parts.append("\n\n")
 
         # 总览表
-        md += "### 总览\n\n"
-        md += "| 策略 | 命中数 |\n|------|--------|\n"
-        md += f"| 三日反转 | {len(reversal_results)} |\n"
-        md += f"| 放量突破 | {len(volume_results)} |\n"
-        md += f"| 缩量突破 | {len(shrink_results)} |\n\n"
+        parts.append("### 总览\n\n")
+        parts.append("| 策略 | 命中数 |\n|------|--------|\n")
+        parts.append(f"| 三日反转 | {len(reversal_results)} |\n")
+        parts.append(f"| 放量突破 | {len(volume_results)} |\n")
+        parts.append(f"| 缩量突破 | {len(shrink_results)} |\n\n")
 
         # 交叉验证: 多策略共振
-        hit_map = {}
-        for r in reversal_results:
-            hit_map.setdefault(r['code'], {'name': r['name'], 'strategies': [], 'scores': {}})
-            hit_map[r['code']]['strategies'].append('三日反转')
-            hit_map[r['code']]['scores']['三日反转'] = r.get('score', 0)
-        for r in volume_results:
-            hit_map.setdefault(r['code'], {'name': r['name'], 'strategies': [], 'scores': {}})
-            hit_map[r['code']]['strategies'].append('放量突破')
-            hit_map[r['code']]['scores']['放量突破'] = r.get('score', 0)
-        for r in shrink_results:
-            hit_map.setdefault(r['code'], {'name': r['name'], 'strategies': [], 'scores': {}})
-            hit_map[r['code']]['strategies'].append('缩量突破')
-            hit_map[r['code']]['scores']['缩量突破'] = r.get('score', 0)
-
-        multi_hit = {k: v for k, v in hit_map.items() if len(v['strategies']) >= 2}
+        # 每条记录随建表累计命中策略数count，排序时不再重复计算len
+        hit_map = defaultdict(lambda: {'name': '', 'strategies': [], 'scores': {}, 'count': 0})
+        for results, label in ((reversal_results, '三日反转'),
+                               (volume_results, '放量突破'),
+                               (shrink_results, '缩量突破')):
+            for r in results:
+                entry = hit_map[r['code']]
+                if not entry['name']:
+                    entry['name'] = r['name']
+                entry['strategies'].append(label)
+                entry['scores'][label] = r.get('score', 0)
+                entry['count'] += 1
+
+        multi_hit = {k: v for k, v in hit_map.items() if v['count'] >= 2}
         if multi_hit:
-            md += "### 多策略共振\n\n"
-            md += "| 代码 | 名称 | 命中策略 | 各策略评分 |\n"
-            md += "|------|------|----------|------------|\n"
-            for code, info in sorted(multi_hit.items(),
-                                     key=lambda x: len(x[1]['strategies']), reverse=True):
+            parts.append("### 多策略共振\n\n")
+            parts.append("| 代码 | 名称 | 命中策略 | 各策略评分 |\n")
+            parts.append("|------|------|----------|------------|\n")
+            for code, info in sorted(multi_hit.items(), key=lambda x: x[1]['count'], reverse=True):
                 strategies = ', '.join(info['strategies'])
                 scores = ', '.join(f"{s}:{info['scores'][s]}" for s in info['strategies'])
-                md += f"| {code} | {info['name']} | {strategies} | {scores} |\n"
-            md += "\n"
+                parts.append(f"| {code} | {info['name']} | {strategies} | {scores} |\n")
+            parts.append("\n")
 
         # 策略一: 三日反转
         if reversal_results:
-            md += "### 策略一: 三日反转\n\n"
-            md += "| 代码 | 名称 | 前置跌幅 | 三日形态 | D2跳空 | 评分 |\n"
-            md += "|------|------|----------|----------|--------|------|\n"
-            for r in reversal_results:
-                pattern = f"{r['day1_change']:+.1f}% → {r['day2_change']:+.1f}% → {r['day3_change']:+.1f}%"
-                d2_gap = f"{r['day2_gap']:+.1f}%" if r['day2_gap'] < 0 else "无"
-                md += f"| {r['code']} | {r['name']} | {r['prior_decline']:+.1f}% | {pattern} | {d2_gap} | {r['score']} |\n"
-            md += "\n"
+            parts.append("### 策略一: 三日反转\n\n")
+            parts.append(_REVERSAL_HEAD)
+            # D2跳空需按正负分支，作为额外字段传入，不改动结果dict
+            row = _REVERSAL_ROW.format
+            parts.extend(row(**r, d2_gap=f"{r['day2_gap']:+.1f}%" if r['day2_gap'] < 0 else "无")
+                         for r in reversal_results)
+            parts.append("\n")
 
         # 策略二: 放量突破
         if volume_results:
-            md += "### 策略二: 放量突破\n\n"
-            md += "| 代码 | 名称 | 涨停日期 | 回踩天数 | 突破量比 | 评分 |\n"
-            md += "|------|------|----------|----------|----------|------|\n"
-            for r in volume_results:
-                md += (f"| {r['code']} | {r['name']} | {r['limit_up_date']} | "
-                       f"{r['post_consol_days']}天 | {r['break_vol_ratio']:.2f}x | {r['score']} |\n")
-            md += "\n"
+            parts.append("### 策略二: 放量突破\n\n")
+            parts.append(_VOLUME_BREAKOUT_HEAD)
+            parts.extend(map(_VOLUME_BREAKOUT_ROW.format_map, volume_results))
+            parts.append("\n")
 
         # 策略三: 缩量突破
         if shrink_results:
-            md += "### 策略三: 缩量突破\n\n"
-            md += "| 代码 | 名称 | 涨停日期 | 涨停形态 | MA5/MA10 | 评分 |\n"
-            md += "|------|------|----------|----------|----------|------|\n"
-            for r in shrink_results:
-                md += (f"| {r['code']} | {r['name']} | {r['limit_up_date']} | "
-                       f"{r['limit_up_type']} | {r['vol_ratio']:.4f} | {r['score']} |\n")
-            md += "\n"
+            parts.append("### 策略三: 缩量突破\n\n")
+            parts.append(_SHRINK_BREAKOUT_HEAD)
+            parts.extend(map(_SHRINK_BREAKOUT_ROW.format_map, shrink_results))
+            parts.append("\n")
 
         if not reversal_results and not volume_results and not shrink_results:
-            md += "今日没有符合条件的股票。\n\n"
+            parts.append("今日没有符合条件的股票。\n\n")
+
+        parts.append("---\n*本工具仅供学习研究使用，不构成任何投资建议。股市有风险，投资需谨慎。*\n")
+        return "".join(parts)
+
+
+# 子进程内的选股器实例（由 _init_worker 创建并登录 BaoStock）
+_worker_screener = None
+
+
+def _init_worker():
+    """筛选子进程初始化：每个进程独立登录 BaoStock，进程正常退出时登出
+
+    fork 出的子进程不执行 atexit，用 multiprocessing 的 Finalize 注册登出（进程退出前执行）。
+    超时保护触发时主进程直接 terminate 子进程，这些会话只能等服务端超时回收。
+    """
+    global _worker_screener
+    _worker_screener = CombinedScreenerCloud()
+    _worker_screener.login()
+    Finalize(_worker_screener, _worker_screener.logout, exitpriority=10)
+
 
-        md += "---\n*本工具仅供学习研究使用，不构成任何投资建议。股市有风险，投资需谨慎。*\n"
-        return md
+def screen_single_stock_worker(item):
+    """子进程内筛选单只股票，item 为 (下标, stock)，返回 (下标, flags, rv, vb, sb)"""
+    idx, stock = item
+    try:
+        return (idx, *_worker_screener.screen_single_stock_flags(stock['bs_code'], stock['code'], stock['name']))
+    except Exception:
+        return idx, 0, None, None, None
 
 
 def main():
@@ -0,0 +1,155 @@
+"""K线增量缓存回归测试：重叠校验、不重复追加、未收盘K线刷新"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import combined_screener_cloud as cloud  # noqa: E402
+from combined_screener_cloud import CombinedScreenerCloud, StockArrays  # noqa: E402
+
+DATES = [f'2025-12-{d:02d}' for d in range(1, 31)]
+CLOSES = [10.0 + i * 0.1 for i in range(30)]
+
+
+def _arrays(dates, closes):
+    closes = np.array(closes, dtype=np.float64)
+    return StockArrays(
+        date=np.array(dates, dtype=object),
+        open=closes.copy(),
+        high=closes.copy(),
+        low=closes.copy(),
+        close=closes,
+        volume=np.full(len(closes), 1000, dtype=np.int64),
+    )
+
+
+def _screener(tmp_path, monkeypatch, fetch):
+    monkeypatch.setenv('CACHE_DIR', str(tmp_path))
+    screener = CombinedScreenerCloud()
+    monkeypatch.setattr(screener, '_fetch_history', fetch)
+    return screener
+
+
+def _set_mtime_beijing(path, hour, minute, days_ago=0):
+    """把缓存文件mtime设为北京时间某日某时刻"""
+    now = datetime.now(cloud._BEIJING_TZ)
+    written = (now - timedelta(days=days_ago)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+    ts = written.timestamp()
+    os.utime(path, (ts, ts))
+
+
+def test_tail_non_positive_is_empty():
+    arrs = _arrays(['2025-12-29', '2025-12-30'], [10.0, 10.5])
+    assert len(arrs.tail(0)) == 0
+    assert len(arrs.tail(-1)) == 0
+    assert list(arrs.tail(1).date) == ['2025-12-30']
+    assert len(arrs.tail(5)) == 2
+
+
+def test_overlap_only_does_not_duplicate_last_bar(tmp_path, monkeypatch):
+    def fetch(bs_code, start_date=None):
+        if start_date is None:
+            return _arrays(DATES, CLOSES)
+        # 周末/节假日：增量请求只返回已缓存的最后两根
+        assert start_date == DATES[-2]
+        return _arrays(DATES[-2:], CLOSES[-2:])
+
+    screener = _screener(tmp_path, monkeypatch, fetch)
+    cache_path = screener._history_cache_path('sh.600000')
+
+    first = screener.get_stock_history('sh.600000')
+    assert len(first) == 30
+
+    for _ in range(3):
+        # 让缓存看起来是前一天写入的，强制走增量更新
+        os.utime(cache_path, (0, 0))
+        arrs = screener.get_stock_history('sh.600000')
+        assert len(arrs) == 30
+        assert list(arrs.date[-2:]) == DATES[-2:]
+
+
+def test_incremental_appends_only_new_dates(tmp_path, monkeypatch):
+    def fetch(bs_code, start_date=None):
+        if start_date is None:
+            return _arrays(DATES, CLOSES)
+        return _arrays(DATES[-2:] + ['2025-12-31'], CLOSES[-2:] + [13.5])
+
+    screener = _screener(tmp_path, monkeypatch, fetch)
+    cache_path = screener._history_cache_path('sh.600000')
+    screener.get_stock_history('sh.600000')
+
+    os.utime(cache_path, (0, 0))
+    arrs = screener.get_stock_history('sh.600000')
+    assert len(arrs) == 31
+    assert list(arrs.date[-2:]) == ['2025-12-30', '2025-12-31']
+    assert arrs.close[-1] == 13.5
+
+
+def test_overlap_close_compared_to_cent(tmp_path, monkeypatch):
+    full_fetches = []
+
+    def fetch(bs_code, start_date=None):
+        if start_date is None:
+            full_fetches.append(bs_code)
+            return _arrays(DATES, CLOSES)
+        # 另一数据源的重叠日收盘价带浮点噪声，不应触发全量拉取
+        return _arrays(DATES[-2:] + ['2025-12-31'], [CLOSES[-2] + 1e-9, CLOSES[-1], 13.5])
+
+    screener = _screener(tmp_path, monkeypatch, fetch)
+    cache_path = screener._history_cache_path('sh.600000')
+    screener.get_stock_history('sh.600000')
+
+    os.utime(cache_path, (0, 0))
+    arrs = screener.get_stock_history('sh.600000')
+    assert full_fetches == ['sh.600000']
+    assert len(arrs) == 31
+
+
+def test_intraday_bar_is_refreshed_same_day(tmp_path, monkeypatch):
+    live = {'close': 12.0}
+    requests = []
+
+    def fetch(bs_code, start_date=None):
+        requests.append(start_date)
+        if start_date is None:
+            # 盘中首次运行：最后一根为未收盘K线
+            return _arrays(DATES, CLOSES[:-1] + [live['close']])
+        return _arrays(DATES[-2:], [CLOSES[-2], live['close']])
+
+    screener = _screener(tmp_path, monkeypatch, fetch)
+    cache_path = screener._history_cache_path('sh.600000')
+    screener.get_stock_history('sh.600000')
+
+    # 当天盘中写入的缓存不算定格，同日再次运行须重新拉取最后一根
+    _set_mtime_beijing(cache_path, 10, 0)
+    live['close'] = 12.8
+    arrs = screener.get_stock_history('sh.600000')
+    assert requests == [None, DATES[-2]]
+    assert len(arrs) == 30
+    assert arrs.close[-1] == 12.8
+    assert list(arrs.date[-2:]) == DATES[-2:]
+
+
+def test_cache_written_after_close_today_is_used(tmp_path, monkeypatch):
+    requests = []
+
+    def fetch(bs_code, start_date=None):
+        requests.append(start_date)
+        return _arrays(DATES, CLOSES)
+
+    screener = _screener(tmp_path, monkeypatch, fetch)
+    cache_path = screener._history_cache_path('sh.600000')
+    screener.get_stock_history('sh.600000')
+
+    _set_mtime_beijing(cache_path, 15, 45)
+    assert CombinedScreenerCloud._history_cache_settled(os.path.getmtime(cache_path))
+    screener.get_stock_history('sh.600000')
+    assert requests == [None]
+
+    # 昨天收盘后写入的缓存不是今天的，仍需增量更新
+    _set_mtime_beijing(cache_path, 17, 0, days_ago=1)
+    assert not CombinedScreenerCloud._history_cache_settled(os.path.getmtime(cache_path))
@@ -0,0 +1,113 @@
+"""输出/缓存辅助函数测试：_write_csv、_write_atomic、_prune_daily_cache"""
+
+import builtins
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import combined_screener_cloud as cloud  # noqa: E402
+
+COLUMNS = ('code', 'name', 'engulfed', 'prior_decline', 'score')
+RESULTS = [
+    {'code': '600000', 'name': '浦发银行', 'engulfed': True, 'prior_decline': -12.5, 'score': 80},
+    {'code': '000001', 'name': '平安银行', 'engulfed': False, 'prior_decline': -8.25, 'score': 65},
+]
+
+
+def _block_pyarrow(monkeypatch):
+    real_import = builtins.__import__
+
+    def fake_import(name, *args, **kwargs):
+        if name == 'pyarrow' or name.startswith('pyarrow.'):
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, '__import__', fake_import)
+
+
+@pytest.mark.parametrize('use_pyarrow', [True, False], ids=['pyarrow', 'pandas'])
+def test_write_csv_round_trips(tmp_path, monkeypatch, use_pyarrow):
+    if use_pyarrow:
+        pytest.importorskip('pyarrow')
+    else:
+        _block_pyarrow(monkeypatch)
+    path = str(tmp_path / 'out.csv')
+    cloud._write_csv(RESULTS, path, COLUMNS)
+
+    with open(path, 'rb') as f:
+        assert f.read(3) == b'\xef\xbb\xbf'  # Excel识别UTF-8需要BOM
+    df = pd.read_csv(path, encoding='utf-8-sig', dtype={'code': str})
+    assert tuple(df.columns) == COLUMNS
+    assert df['code'].tolist() == ['600000', '000001']
+    assert df['name'].tolist() == ['浦发银行', '平安银行']
+    assert df['engulfed'].tolist() == [True, False]
+    assert df['prior_decline'].tolist() == [-12.5, -8.25]
+    assert df['score'].tolist() == [80, 65]
+
+
+def test_write_csv_pyarrow_format(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'out.csv')
+    cloud._write_csv(RESULTS[:1], path, COLUMNS)
+    with open(path, encoding='utf-8-sig') as f:
+        lines = f.read().splitlines()
+    # pyarrow写出格式：表头与字符串带引号，布尔为 true/false（见 README 输出文件说明）
+    assert lines == ['"code","name","engulfed","prior_decline","score"',
+                     '"600000","浦发银行",true,-12.5,80']
+
+
+def test_write_csv_missing_column_is_empty(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    rows = [dict(RESULTS[0]), {k: v for k, v in RESULTS[1].items() if k != 'score'}]
+    cloud._write_csv(rows, path, COLUMNS)
+    df = pd.read_csv(path, encoding='utf-8-sig', dtype={'code': str})
+    assert df['score'].iloc[0] == 80
+    assert pd.isna(df['score'].iloc[1])
+
+
+def test_write_atomic_replaces_without_leftovers(tmp_path):
+    path = str(tmp_path / 'latest_results.json')
+    with open(path, 'wb') as f:
+        f.write(b'old')
+    cloud._write_atomic(path, b'{"new": true}')
+    with open(path, 'rb') as f:
+        assert f.read() == b'{"new": true}'
+    assert os.listdir(tmp_path) == ['latest_results.json']
+
+
+def test_write_atomic_failure_keeps_old_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'results.md')
+    with open(path, 'wb') as f:
+        f.write(b'old')
+
+    def broken_replace(src, dst):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(cloud.os, 'replace', broken_replace)
+    with pytest.raises(OSError):
+        cloud._write_atomic(path, b'new')
+    with open(path, 'rb') as f:
+        assert f.read() == b'old'
+
+
+def test_prune_daily_cache_keeps_today_and_other_prefixes(tmp_path):
+    for name in ('stock_list_20250101.parquet', 'stock_list_20250102.parquet',
+                 'names_20250101.json', 'names_20250102.json.tmp'):
+        (tmp_path / name).write_bytes(b'x')
+    (tmp_path / 'hist').mkdir()
+    keep = str(tmp_path / 'stock_list_20250102.parquet')
+
+    cloud._prune_daily_cache(str(tmp_path), 'stock_list_', keep)
+    assert sorted(os.listdir(tmp_path)) == ['hist', 'names_20250101.json', 'names_20250102.json.tmp',
+                                            'stock_list_20250102.parquet']
+
+    cloud._prune_daily_cache(str(tmp_path), 'names_', str(tmp_path / 'names_20250103.json'))
+    assert sorted(os.listdir(tmp_path)) == ['hist', 'stock_list_20250102.parquet']
+
+
+def test_prune_daily_cache_missing_dir_is_ignored(tmp_path):
+    cloud._prune_daily_cache(str(tmp_path / 'absent'), 'names_', 'names_20250101.json')
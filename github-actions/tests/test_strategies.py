@@ -0,0 +1,83 @@
+"""策略黄金测试：固定K线逐个跑 check_*，命中结果须与基线pandas实现完全一致
+
+tests/data/strategy_golden.json 中的期望值由首个提交（pandas逐行实现）生成，
+numpy 列数组改写后的三个策略必须给出相同的判定和详情dict。
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import combined_screener_cloud as cloud  # noqa: E402
+from combined_screener_cloud import CombinedScreenerCloud, StockArrays  # noqa: E402
+
+with open(os.path.join(HERE, 'data', 'strategy_golden.json'), encoding='utf-8') as f:
+    CASES = json.load(f)['cases']
+
+
+def _arrays(case):
+    return StockArrays.from_frame(pd.DataFrame(case['kline']))
+
+
+def _plain(detail):
+    """numpy标量转为Python值，便于与JSON期望值比较"""
+    return {k: (v.item() if isinstance(v, np.generic) else v) for k, v in detail.items()}
+
+
+def _check(screener, key, arrs, code):
+    if key == 'reversal':
+        return screener.check_reversal_pattern(arrs)
+    if key == 'volume_breakout':
+        return screener.check_volume_breakout_pattern(arrs, code)
+    return screener.check_shrink_breakout_pattern(arrs, code)
+
+
+@pytest.fixture(scope='module')
+def screener():
+    return CombinedScreenerCloud()
+
+
+@pytest.mark.parametrize('key', ['reversal', 'volume_breakout', 'shrink_breakout'])
+@pytest.mark.parametrize('case', CASES, ids=[c['name'] for c in CASES])
+def test_check_pattern_matches_golden(screener, case, key):
+    match, detail = _check(screener, key, _arrays(case), case['code'])
+    expected = case['expected'][key]
+    if expected is None:
+        assert not match
+    else:
+        assert match
+        assert _plain(detail) == expected
+
+
+def test_golden_cases_cover_every_strategy():
+    for key in ('reversal', 'volume_breakout', 'shrink_breakout'):
+        assert any(c['expected'][key] is not None for c in CASES)
+    assert any(all(v is None for v in c['expected'].values()) for c in CASES)
+
+
+@pytest.mark.parametrize('case', CASES, ids=[c['name'] for c in CASES])
+def test_screen_single_stock_flags_agrees_with_checks(screener, case, monkeypatch):
+    arrs = _arrays(case)
+    monkeypatch.setattr(screener, 'get_stock_history', lambda bs_code: arrs)
+    flags, rv, vb, sb = screener.screen_single_stock_flags('sh.' + case['code'], case['code'], '测试')
+
+    # 收阴线直接跳过；放量突破另需放量
+    bullish = arrs.close[-1] > arrs.open[-1]
+    volume_up = arrs.volume[-2] != 0 and arrs.volume[-1] > arrs.volume[-2]
+    expected = case['expected']
+    for bit, hit, key, gate in ((cloud.HIT_REVERSAL, rv, 'reversal', bullish),
+                                (cloud.HIT_VOLUME_BREAKOUT, vb, 'volume_breakout', bullish and volume_up),
+                                (cloud.HIT_SHRINK_BREAKOUT, sb, 'shrink_breakout', bullish)):
+        if gate and expected[key] is not None:
+            assert flags & bit
+            assert _plain(hit) == {'code': case['code'], 'name': '测试', **expected[key]}
+        else:
+            assert not flags & bit
+            assert hit is None
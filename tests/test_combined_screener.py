@@ -0,0 +1,46 @@
+"""本地版输出辅助函数测试：_write_csv（pyarrow写入器与pandas降级）"""
+
+import builtins
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import combined_screener  # noqa: E402
+
+FRAME = pd.DataFrame({
+    'code': ['600000', '000001'],
+    'name': ['浦发银行', '平安银行'],
+    'engulfed': [True, False],
+    'change': [-12.5, 3.0],
+    'score': [80, 65],
+})
+
+
+def _block_pyarrow(monkeypatch):
+    real_import = builtins.__import__
+
+    def fake_import(name, *args, **kwargs):
+        if name == 'pyarrow' or name.startswith('pyarrow.'):
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, '__import__', fake_import)
+
+
+@pytest.mark.parametrize('use_pyarrow', [True, False], ids=['pyarrow', 'pandas'])
+def test_write_csv_round_trips(tmp_path, monkeypatch, use_pyarrow):
+    if use_pyarrow:
+        pytest.importorskip('pyarrow')
+    else:
+        _block_pyarrow(monkeypatch)
+    path = str(tmp_path / 'out.csv')
+    combined_screener._write_csv(FRAME, path)
+
+    with open(path, 'rb') as f:
+        assert f.read(3) == b'\xef\xbb\xbf'  # Excel识别UTF-8需要BOM
+    df = pd.read_csv(path, encoding='utf-8-sig', dtype={'code': str})
+    pd.testing.assert_frame_equal(df, FRAME, check_dtype=False)